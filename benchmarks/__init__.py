@@ -0,0 +1,6 @@
+"""
+swagger_doc 性能基准
+
+    python -m benchmarks --endpoints 10 1000 10000 --output result.json
+    python -m benchmarks --endpoints 1000 --compare result.json
+"""
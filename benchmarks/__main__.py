@@ -0,0 +1,46 @@
+import argparse
+import json
+import sys
+
+from . import auth, paths, spec, validate
+from .runner import compare, environment
+from .synth import make_routes
+
+BENCHMARKS = {**spec.BENCHMARKS, **paths.BENCHMARKS, **validate.BENCHMARKS, **auth.BENCHMARKS}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="swagger_doc benchmarks")
+    parser.add_argument("--endpoints", type=int, nargs="+", default=[10, 1000, 10000], help="接口数量")
+    parser.add_argument("--models", type=int, default=20, help="不同的请求/响应模型数量")
+    parser.add_argument("--depth", type=int, default=3, help="模型嵌套层数")
+    parser.add_argument("--enums", type=int, default=2, help="每个模型的枚举字段数量")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="只运行指定的基准")
+    parser.add_argument("--output", help="结果写入的 json 文件")
+    parser.add_argument("--compare", help="与之前保存的结果对比")
+    args = parser.parse_args(argv)
+
+    results = []
+    for endpoints in args.endpoints:
+        routes = make_routes(endpoints, models=args.models, depth=args.depth, enums=args.enums)
+        params = {"endpoints": endpoints, "models": args.models, "depth": args.depth, "enums": args.enums}
+        for name in args.only or BENCHMARKS:
+            result = {"name": name, "params": params, **BENCHMARKS[name](routes, repeat=args.repeat)}
+            results.append(result)
+            print(f"{name:<24} endpoints={endpoints:<6} median={result['median'] * 1000:10.3f}ms", file=sys.stderr)
+
+    output = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+
+    if args.compare:
+        for key, before, after, ratio in compare(results, args.compare):
+            print(f"{key:<80} {before * 1000:10.3f}ms -> {after * 1000:10.3f}ms  x{ratio:.2f}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
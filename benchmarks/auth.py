@@ -0,0 +1,29 @@
+"""文档页面 Basic 认证的单次校验耗时, 与路由数量无关"""
+
+import base64
+
+from swagger_doc import HashedAuth, PlainAuth, hash_password
+
+from .runner import timeit
+
+HEADER = "Basic " + base64.b64encode(b"swagger:swagger").decode()
+
+
+def bench_auth_plain(routes, repeat: int, number: int = 100000) -> dict:
+    """预先计算的认证头, 常数时间比较"""
+    auth = PlainAuth("swagger", "swagger")
+    assert auth.check(HEADER)
+    return timeit(lambda: auth.check(HEADER), repeat=repeat, number=number)
+
+
+def bench_auth_hashed(routes, repeat: int, number: int = 100000) -> dict:
+    """密码摘要, 第一次校验后命中缓存"""
+    auth = HashedAuth("swagger", hash_password("swagger"))
+    assert auth.check(HEADER)
+    return timeit(lambda: auth.check(HEADER), repeat=repeat, number=number)
+
+
+BENCHMARKS = {
+    "auth_plain": bench_auth_plain,
+    "auth_hashed": bench_auth_hashed,
+}
@@ -0,0 +1,63 @@
+"""路由正则转换为 openapi 路径, 与 0.0.12 的实现对比"""
+
+import logging
+import re
+
+from swagger_doc.builders import format_handler_path, iter_routes, try_extract_docs
+
+from .runner import timeit
+
+
+def legacy_extract_parameters_names(handler, parameters_count):
+    if parameters_count == 0:
+        return []
+
+    parameters = ["{?}" for _ in range(parameters_count)]
+
+    for method in handler.SUPPORTED_METHODS:
+        method_handler = getattr(handler, method.lower())
+        args = try_extract_docs(method_handler)
+
+        if len(args) > 0:
+            for i, arg in enumerate(args):
+                if set(arg) != {"_"}:
+                    try:
+                        parameters[i] = arg
+                    except:
+                        logging.warning(f"{handler.__name__} {method} 参数传递有误")
+
+    return parameters
+
+
+def legacy_format_handler_path(target, route_pattern, groups):
+    brackets_regex = re.compile(r"\(.*?\)")
+    parameters = legacy_extract_parameters_names(target, groups)
+
+    for i, entity in enumerate(brackets_regex.findall(route_pattern)):
+        route_pattern = route_pattern.replace(entity, "{%s}" % parameters[i], 1)
+
+    return route_pattern[:-1]
+
+
+def _bench(format_path, routes, repeat):
+    handlers = list(iter_routes(routes))
+
+    def run():
+        for target, regex in handlers:
+            format_path(target, regex.pattern, regex.groups)
+
+    return timeit(run, repeat=repeat)
+
+
+def bench_path_format(routes, repeat: int) -> dict:
+    return _bench(format_handler_path, routes, repeat)
+
+
+def bench_path_format_legacy(routes, repeat: int) -> dict:
+    return _bench(legacy_format_handler_path, routes, repeat)
+
+
+BENCHMARKS = {
+    "path_format": bench_path_format,
+    "path_format_legacy": bench_path_format_legacy,
+}
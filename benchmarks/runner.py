@@ -0,0 +1,62 @@
+import json
+import platform
+import statistics
+import time
+
+import pydantic
+import tornado
+
+import swagger_doc
+
+
+def timeit(func, repeat: int = 5, number: int = 1, setup=None) -> dict:
+    """执行 repeat 轮, 每轮调用 func number 次, 返回单次调用耗时(秒)的统计"""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return {
+        "repeat": repeat,
+        "number": number,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+    }
+
+
+def environment() -> dict:
+    return {
+        "swagger_doc": swagger_doc.__version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "pydantic": pydantic.VERSION,
+        "tornado": tornado.version,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def result_key(result: dict) -> str:
+    return "{name}[{params}]".format(
+        name=result["name"],
+        params=",".join(f"{k}={v}" for k, v in sorted(result["params"].items())),
+    )
+
+
+def compare(results: list, baseline_path: str) -> list:
+    """与之前保存的结果对比, 返回 (key, 基线中位数, 当前中位数, 比值)"""
+    with open(baseline_path, "r") as f:
+        baseline = {result_key(i): i for i in json.load(f)["results"]}
+
+    ret = []
+    for result in results:
+        key = result_key(result)
+        if key not in baseline:
+            continue
+        before, after = baseline[key]["median"], result["median"]
+        ret.append((key, before, after, after / before if before else float("inf")))
+    return ret
@@ -0,0 +1,78 @@
+"""spec 生成, json 序列化和 OpenapiHomeHandler 请求耗时"""
+
+import base64
+
+import tornado.web
+from tornado.testing import AsyncHTTPTestCase
+
+from swagger_doc import export_swagger, setup_swagger
+from swagger_doc.models import clear_schema_cache
+from swagger_doc.utils import JSON_BACKENDS, dump_openapi_json
+
+from .runner import timeit
+
+AUTH_HEADERS = {"Authorization": "Basic " + base64.b64encode(b"swagger:swagger").decode()}
+
+
+def bench_spec_build(routes, repeat: int) -> dict:
+    """冷启动: 每轮前清空模型 schema 缓存"""
+    return timeit(lambda: export_swagger(routes), repeat=repeat, setup=clear_schema_cache)
+
+
+def bench_spec_build_warm(routes, repeat: int) -> dict:
+    export_swagger(routes)
+    return timeit(lambda: export_swagger(routes), repeat=repeat)
+
+
+def bench_json_dump(routes, repeat: int) -> dict:
+    """默认后端, 安装了 orjson 时使用 orjson"""
+    spec = export_swagger(routes)
+    return timeit(lambda: dump_openapi_json(spec), repeat=repeat)
+
+
+def bench_json_dump_stdlib(routes, repeat: int) -> dict:
+    spec = export_swagger(routes)
+    return timeit(lambda: dump_openapi_json(spec, "json"), repeat=repeat)
+
+
+def bench_json_dump_orjson(routes, repeat: int) -> dict:
+    spec = export_swagger(routes)
+    return timeit(lambda: dump_openapi_json(spec, "orjson"), repeat=repeat)
+
+
+class _OpenapiCase(AsyncHTTPTestCase):
+    routes = None
+
+    def get_app(self):
+        routes = list(self.routes)
+        setup_swagger(routes)
+        return tornado.web.Application(routes)
+
+    def runTest(self):
+        pass
+
+
+def bench_openapi_handler(routes, repeat: int, number: int = 20) -> dict:
+    """通过 AsyncHTTPTestCase 请求 /openapi.json 的耗时"""
+    case = type("OpenapiCase", (_OpenapiCase,), {"routes": routes})()
+    case.setUp()
+    try:
+        return timeit(
+            lambda: case.fetch("/openapi.json", headers=AUTH_HEADERS, decompress_response=False),
+            repeat=repeat,
+            number=number,
+        )
+    finally:
+        case.tearDown()
+
+
+BENCHMARKS = {
+    "spec_build": bench_spec_build,
+    "spec_build_warm": bench_spec_build_warm,
+    "json_dump": bench_json_dump,
+    "json_dump_stdlib": bench_json_dump_stdlib,
+    "openapi_handler": bench_openapi_handler,
+}
+# 没有安装 orjson 时不运行
+if "orjson" in JSON_BACKENDS:
+    BENCHMARKS["json_dump_orjson"] = bench_json_dump_orjson
@@ -0,0 +1,85 @@
+"""按规模生成测试用的路由表和 pydantic 模型"""
+
+from enum import IntEnum
+from typing import List, Optional
+
+import tornado.web
+from pydantic import Field, create_model
+
+from swagger_doc import SBody, SPath, SQuery, SResponse200, SResponse400, swagger_doc
+
+
+def make_enums(count: int) -> List[type]:
+    return [IntEnum(f"BenchEnum{i}", {f"value{j}": j for j in range(1, 4)}) for i in range(count)]
+
+
+def make_model(name: str, depth: int, enums: List[type], base=SBody):
+    """生成嵌套 depth 层的模型, 每层带有普通字段, 枚举字段, 子模型和子模型列表"""
+    child = make_model(f"{name}Child", depth - 1, enums, base=None) if depth > 1 else None
+
+    fields = {
+        "name": (str, Field(description="name")),
+        "count": (int, Field(description="count")),
+        "remark": (Optional[str], Field(None, description="remark")),
+    }
+    for i, enum in enumerate(enums):
+        fields[f"enum{i}"] = (enum, Field(description=enum.__name__))
+    if child is not None:
+        fields["child"] = (child, Field(description="child"))
+        fields["children"] = (List[child], Field(description="children"))
+
+    if base is None:
+        return create_model(name, **fields)
+
+    model = create_model(name, __base__=base, **fields)
+    model.__example__ = {"name": name, "count": 1}
+    return model
+
+
+def make_routes(endpoints: int, models: int = 20, depth: int = 3, enums: int = 2):
+    """
+    生成 endpoints 个接口的路由表, 接口之间共享 models 个请求/响应模型
+    """
+    enum_types = make_enums(enums)
+    bodies = [make_model(f"BenchBody{i}", depth, enum_types) for i in range(max(models, 1))]
+
+    class BenchPath(SPath):
+        __example__ = {"item_id": 1}
+
+        item_id: int = Field(description="item id")
+
+    class BenchQuery(SQuery):
+        __example__ = {"limit": 10}
+
+        limit: int = Field(description="limit")
+        offset: Optional[int] = Field(None, description="offset")
+
+    routes = []
+    for i in range(endpoints):
+        body = bodies[i % len(bodies)]
+        resp = bodies[(i + 1) % len(bodies)]
+
+        @swagger_doc(
+            tags=[f"tag{i % 10}"],
+            summary=f"get {i}",
+            path_params=BenchPath,
+            query_params=BenchQuery,
+            responses=[SResponse200(body=resp), SResponse400(body=body)],
+        )
+        def get(self, item_id):
+            self.write({"id": item_id})
+
+        @swagger_doc(
+            tags=[f"tag{i % 10}"],
+            summary=f"post {i}",
+            path_params=BenchPath,
+            request_body=body,
+            responses=[SResponse200(body=resp)],
+        )
+        def post(self, item_id):
+            self.write({"id": item_id})
+
+        handler = type(f"BenchHandler{i}", (tornado.web.RequestHandler,), {"get": get, "post": post})
+        routes.append((rf"/bench/{i}/(\d+)", handler))
+
+    return routes
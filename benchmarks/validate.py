@@ -0,0 +1,88 @@
+"""swagger_doc(validate=True) 每个请求增加的校验耗时, 与路由数量无关"""
+
+import json
+
+import tornado.web
+from pydantic import Field
+from tornado.httputil import HTTPHeaders, HTTPServerRequest
+
+from swagger_doc import SBody, SHeader, SObject, SPath, SQuery, SResponse200, swagger_doc
+
+from .runner import timeit
+
+
+class BenchPath(SPath):
+    __example__ = {"item_id": 1}
+
+    item_id: int = Field(description="id")
+
+
+class BenchQuery(SQuery):
+    __example__ = {"page": 1, "size": 20}
+
+    page: int = Field(1, description="page")
+    size: int = Field(20, description="size")
+
+
+class BenchHeader(SHeader):
+    __example__ = {"x_token": "abc"}
+
+    x_token: str = Field(description="token")
+
+
+class BenchBody(SBody):
+    __example__ = {"name": "abc", "count": 1, "tags": ["a"]}
+
+    name: str = Field(description="名称")
+    count: int = Field(description="数量")
+    tags: list = Field(description="标签")
+
+
+class BenchResp(SObject):
+    __example__ = {"code": 0}
+
+    code: int = Field(description="code")
+
+
+class BenchHandler(tornado.web.RequestHandler):
+    @swagger_doc(
+        tags=["bench"],
+        summary="bench",
+        responses=[SResponse200(body=BenchResp)],
+        path_params=BenchPath,
+        query_params=BenchQuery,
+        header_params=BenchHeader,
+        request_body=BenchBody,
+        validate=True,
+    )
+    def post(self, item_id):
+        pass
+
+
+class _Connection:
+    def set_close_callback(self, callback):
+        pass
+
+
+def _make_handler():
+    request = HTTPServerRequest(
+        method="POST",
+        uri="/items/3?page=2&size=50",
+        headers=HTTPHeaders({"X-Token": "abc", "Content-Type": "application/json"}),
+        body=json.dumps({"name": "abc", "count": 3, "tags": ["a", "b"]}).encode(),
+        connection=_Connection(),
+    )
+    return BenchHandler(tornado.web.Application(), request)
+
+
+def bench_validate_request(routes, repeat: int, number: int = 10000) -> dict:
+    """path/query/header/json body 各一个模型时, 单次校验的耗时"""
+    handler = _make_handler()
+    validator = BenchHandler.post.__validator__
+    assert validator.validate(handler, ("3",), {})
+    return timeit(lambda: validator.validate(handler, ("3",), {}), repeat=repeat, number=number)
+
+
+BENCHMARKS = {
+    "validate_request": bench_validate_request,
+}
@@ -0,0 +1,33 @@
+import gzip
+import os
+
+from setuptools import setup
+from setuptools.command.build_py import build_py
+
+STATIC_DIRS = [os.path.join("swagger_doc", "static", "swagger_ui"), os.path.join("swagger_doc", "static", "redoc_ui")]
+COMPRESS_SUFFIXES = (".js", ".css")
+
+
+class BuildPyWithCompressedStatic(build_py):
+    """打包时为 js/css 生成 .gz 文件, 运行时 SwaggerStaticHandler 直接返回压缩后的文件"""
+
+    def run(self):
+        super().run()
+        # editable 安装时不会复制文件到 build_lib, 运行时直接返回未压缩的文件
+        if getattr(self, "editable_mode", False):
+            return
+        for static_dir in STATIC_DIRS:
+            target_dir = os.path.join(self.build_lib, static_dir)
+            if not os.path.isdir(target_dir):
+                continue
+            for name in os.listdir(target_dir):
+                if not name.endswith(COMPRESS_SUFFIXES):
+                    continue
+                path = os.path.join(target_dir, name)
+                with open(path, "rb") as f:
+                    content = gzip.compress(f.read(), compresslevel=9, mtime=0)
+                with open(path + ".gz", "wb") as f:
+                    f.write(content)
+
+
+setup(cmdclass={"build_py": BuildPyWithCompressedStatic})
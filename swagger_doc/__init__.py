@@ -3,17 +3,22 @@ __version__ = "0.0.12"
 import importlib
 import json
 import os
+import urllib.parse
 from enum import Enum
 from pathlib import Path
-from typing import List, Type, Union
+from typing import Callable, List, Type, Union
 
 import tornado.web
 
-from .builders import generate_doc_from_endpoints
+from .auth import BasicAuth, CallbackAuth, HashedAuth, PlainAuth, hash_password
+from .builders import generate_doc_from_endpoints, split_doc_by_tags
+from .cache import OperationCache
 from .handlers import *
 from .models import *
 from .models import SObjectMeta
-from .utils import CJsonEncoder
+from .registry import DocRegistry, SharedSpecs
+from .utils import CJsonEncoder, copy_tree, dump_openapi_json
+from .validation import RESPONSE_CHECKER, ResponseChecker, validate_request
 
 STATIC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "static"))
 
@@ -27,9 +32,14 @@ def export_swagger(
     contact="",
     external_docs=None,
     security=None,
+    use_components: bool = False,
+    workers: int = 0,
+    cache_dir: str = None,
 ):
-    return generate_doc_from_endpoints(
+    openapi_schema, _ = _generate_openapi(
         routes,
+        cache_dir,
+        workers,
         servers=servers,
         description=description,
         api_version=api_version,
@@ -37,46 +47,96 @@ def export_swagger(
         contact=contact,
         external_docs=external_docs,
         security=security,
+        use_components=use_components,
     )
+    # 接口和模型的文档是缓存共享的, 调用方拿到的是可以修改的副本
+    return copy_tree(openapi_schema)
 
 
-def load_swagger_template(openapi_schema):
-    base_path = os.path.join(STATIC_PATH, "swagger_ui")
-    with open(os.path.join(base_path, "swagger-ui-bundle.js"), "r") as f:
-        swagger_ui_bundle_js = f.read()
+def _generate_openapi(routes, cache_dir=None, workers=0, **options):
+    """
+    返回 (openapi 文档, 序列化后的内容)
+    cache_dir 不为空时, 路由和模型都没有变化则直接读取之前生成的文档
+    """
+    docs = DocRegistry(routes, cache_dir, workers, **options)
+    docs.build()
+    return docs.schema, docs.content
 
-    with open(os.path.join(base_path, "swagger-ui-standalone-preset.js"), "r") as f:
-        swagger_ui_standalone_preset_js = f.read()
 
-    with open(os.path.join(base_path, "swagger-ui.css"), "r") as f:
-        swagger_ui_css = f.read()
+def _read_static(path):
+    with open(os.path.join(STATIC_PATH, path), "r") as f:
+        return f.read()
+
+
+def _static_url(static_url_prefix, path):
+    """带内容hash的静态资源地址, 浏览器可长期缓存"""
+    settings = {"static_path": STATIC_PATH, "static_url_prefix": static_url_prefix}
+    return SwaggerStaticHandler.make_static_url(settings, path)
 
-    with open(os.path.join(base_path, "ui.jinja2"), "r") as f:
-        SwaggerHomeHandler.SWAGGER_HOME_TEMPLATE = (
-            f.read()
-            .replace("{{ SWAGGER_SCHEMA }}", json.dumps(openapi_schema, cls=CJsonEncoder))
-            .replace("{{ SWAGGER-CSS }}", swagger_ui_css)
-            .replace("{{ SWAGGER-UI-BUNDLE }}", swagger_ui_bundle_js)
-            .replace("{{ SWAGGER-UI-STANDALONE-PRESET }}", swagger_ui_standalone_preset_js)
-        )
 
+def _style_tag(path, static_url_prefix=None):
+    if static_url_prefix is None:
+        return "<style>\n{}\n</style>".format(_read_static(path))
+    return '<link rel="stylesheet" type="text/css" href="{}">'.format(_static_url(static_url_prefix, path))
 
-def load_redoc_template(openapi_schema):
-    base_path = os.path.join(STATIC_PATH, "redoc_ui")
 
-    with open(os.path.join(base_path, "redoc.css"), "r") as f:
-        redoc_css = f.read()
+def _script_tag(path, static_url_prefix=None):
+    if static_url_prefix is None:
+        return '<script type="text/javascript">\n{}\n</script>'.format(_read_static(path))
+    return '<script type="text/javascript" src="{}"></script>'.format(_static_url(static_url_prefix, path))
 
-    with open(os.path.join(base_path, "redoc.js"), "r") as f:
-        redoc_js = f.read()
 
-    with open(os.path.join(base_path, "ui.jinja2"), "r") as f:
-        RedocHomeHandler.REDOC_HOME_TEMPLATE = (
-            f.read()
-            .replace("{{ REDOC_JSON }}", json.dumps(openapi_schema, cls=CJsonEncoder))
-            .replace("{{ REDOC_CSS }}", redoc_css)
-            .replace("{{ REDOC_JS }}", redoc_js)
+def render_swagger_template(openapi_schema, static_url_prefix=None, openapi_url=None, openapi_urls=None) -> str:
+    """
+    static_url_prefix 为空时将js/css内联到页面中, 否则引用静态资源路由
+    openapi_url 不为空时页面从该地址加载文档, 否则将文档内联到页面中
+    openapi_urls: [{"url": ..., "name": ...}], 不为空时页面顶部可以切换文档, 只加载选中的文档
+    """
+    if openapi_urls:
+        spec = "urls: {}".format(dump_openapi_json(openapi_urls).decode("utf8"))
+    elif openapi_url:
+        spec = "url: {}".format(json.dumps(openapi_url))
+    else:
+        spec = "spec: {}".format(dump_openapi_json(openapi_schema).decode("utf8"))
+    return (
+        _read_static("swagger_ui/ui.jinja2")
+        .replace("{{ SWAGGER_SPEC }}", spec)
+        .replace("{{ SWAGGER-CSS }}", _style_tag("swagger_ui/swagger-ui.css", static_url_prefix))
+        .replace("{{ SWAGGER-UI-BUNDLE }}", _script_tag("swagger_ui/swagger-ui-bundle.js", static_url_prefix))
+        .replace(
+            "{{ SWAGGER-UI-STANDALONE-PRESET }}",
+            _script_tag("swagger_ui/swagger-ui-standalone-preset.js", static_url_prefix),
         )
+    )
+
+
+def render_redoc_template(openapi_schema, static_url_prefix=None, openapi_url=None) -> str:
+    """
+    static_url_prefix 为空时将js/css内联到页面中, 否则引用静态资源路由
+    openapi_url 不为空时页面从该地址加载文档, 否则将文档内联到页面中
+    """
+    return (
+        _read_static("redoc_ui/ui.jinja2")
+        .replace("{{ REDOC_JSON }}", dump_openapi_json(openapi_url or openapi_schema).decode("utf8"))
+        .replace("{{ REDOC_CSS }}", _style_tag("redoc_ui/redoc.css", static_url_prefix))
+        .replace("{{ REDOC_JS }}", _script_tag("redoc_ui/redoc.js", static_url_prefix))
+    )
+
+
+def load_swagger_template(
+    openapi_schema, static_url_prefix=None, openapi_url=None, openapi_urls=None, site: DocSite = None
+):
+    """site 为空时更新默认的 DocSite"""
+    site = site or DocSite.DEFAULT
+    site.swagger_template = render_swagger_template(openapi_schema, static_url_prefix, openapi_url, openapi_urls)
+    site.set_content("swagger", site.swagger_template.encode("utf8"))
+
+
+def load_redoc_template(openapi_schema, static_url_prefix=None, openapi_url=None, site: DocSite = None):
+    """site 为空时更新默认的 DocSite"""
+    site = site or DocSite.DEFAULT
+    site.redoc_template = render_redoc_template(openapi_schema, static_url_prefix, openapi_url)
+    site.set_content("redoc", site.redoc_template.encode("utf8"))
 
 
 def setup_swagger(
@@ -94,9 +154,76 @@ def setup_swagger(
     login_username: str = "swagger",
     login_password: str = "swagger",
     swagger_model_path=None,
+    inline_assets: bool = True,
+    lazy: bool = False,
+    use_components: bool = False,
+    workers: int = 0,
+    cache_dir: str = None,
+    lean: bool = False,
+    split_tags: bool = False,
+    dev: bool = False,
+    shared: SharedSpecs = None,
+    auth: Union[BasicAuth, Callable[[str, str], bool]] = None,
 ):
-    openapi_schema = generate_doc_from_endpoints(
-        routes,
+    """
+    inline_assets: 为 True 时 js/css 内联到文档页面中;
+        为 False 时注册 {swagger_url}/static/ 静态路由, 页面通过带内容hash的地址引用, 可被浏览器长期缓存
+    lazy: 为 True 时只注册路由, 文档和页面在第一次访问文档时才生成
+    use_components: 为 True 时模型只在 components/schemas 中生成一次, 其他地方通过 $ref 引用
+    workers: 大于 1 时在进程池中并发生成文档, 适合接口非常多的应用
+    cache_dir: 文档的磁盘缓存目录, 路由和模型都没有变化时直接使用之前生成的文档
+    lean: 节省内存, 页面从 openapi_url 加载文档, js/css 通过静态路由引用, 序列化后只保留一份文档内容
+    split_tags: 为 True 时按 tag 拆分文档, 通过 {openapi_url 去掉 .json}/{tag}.json 访问,
+        swagger 页面顶部选择 tag 后只加载该 tag 的文档, 适合接口非常多的应用
+    dev: 开发模式, 配合 autoreload 使用. 按接口把文档缓存到 cache_dir(默认为 ~/.cache/swagger_doc),
+        重启后只重新生成 handler 或模型所在模块有修改的接口, 页面从 openapi_url 加载文档, 不预先压缩.
+        使用 components 时只使用整份文档的缓存
+    shared: 多次调用 setup_swagger 生成多套文档时(例如公开文档和内部文档)传入同一个 SharedSpecs,
+        模型和相同的接口只生成一次, 各文档的 components/schemas 只包含自己引用到的模型
+    auth: 文档的 Basic 认证, BasicAuth(例如使用密码摘要的 HashedAuth) 或校验 (用户名, 密码) 的函数,
+        为空时使用 login_username/login_password
+
+    每次调用的文档内容和登录账号保存在各自的 DocSite 中, 通过 initialize 参数传给文档 handler,
+    同一个应用中可以多次调用, 使用不同的地址和账号
+    返回 DocRegistry, 运行时添加/删除 handler 后调用它的 add_routes/remove_routes 更新文档
+    """
+    doc_routes = list(routes)
+
+    _swagger_url = "/{}".format(swagger_url) if not swagger_url.startswith("/") else swagger_url
+    _openapi_url = "/{}".format(openapi_url) if not openapi_url.startswith("/") else openapi_url
+    _redoc_url = "/{}".format(redoc_url) if not redoc_url.startswith("/") else redoc_url
+    _base_swagger_url = _swagger_url.rstrip("/")
+    _base_redoc_url = _redoc_url.rstrip("/")
+
+    # 开发模式下不预先压缩, 减少每次重启生成文档的耗时
+    site = DocSite(login_username, login_password, compress=not dev, auth=auth)
+    site_kwargs = {"site": site}
+    routes += [
+        tornado.web.url(_swagger_url, SwaggerHomeHandler, site_kwargs),
+        tornado.web.url(_redoc_url, RedocHomeHandler, site_kwargs),
+        tornado.web.url(_openapi_url, OpenapiHomeHandler, site_kwargs),
+        tornado.web.url("{}/".format(_base_swagger_url), SwaggerHomeHandler, site_kwargs),
+        tornado.web.url("{}/".format(_base_redoc_url), RedocHomeHandler, site_kwargs),
+    ]
+
+    _base_openapi_tag_url = _openapi_url[:-5] if _openapi_url.endswith(".json") else _openapi_url.rstrip("/")
+    if split_tags:
+        routes.append(
+            tornado.web.url(r"{}/([^/]+)\.json".format(_base_openapi_tag_url), OpenapiTagHandler, site_kwargs)
+        )
+
+    static_url_prefix = None
+    if not inline_assets or lean:
+        static_url_prefix = "{}/static/".format(_base_swagger_url)
+        routes.append(
+            tornado.web.url(
+                r"{}(.*)".format(static_url_prefix),
+                SwaggerStaticHandler,
+                {"path": STATIC_PATH},
+            )
+        )
+
+    options = dict(
         servers=servers,
         description=description,
         api_version=api_version,
@@ -104,27 +231,60 @@ def setup_swagger(
         contact=contact,
         external_docs=external_docs,
         security=security,
+        use_components=use_components,
     )
+    operation_cache = None
+    if dev:
+        cache_dir = cache_dir or os.path.join(os.path.expanduser("~"), ".cache", "swagger_doc")
+        if not use_components:
+            operation_cache = OperationCache(cache_dir, __version__, **options)
+    docs = DocRegistry(doc_routes, cache_dir, workers, operation_cache=operation_cache, shared=shared, **options)
+    docs.site = site
 
-    _swagger_url = "/{}".format(swagger_url) if not swagger_url.startswith("/") else swagger_url
-    _openapi_url = "/{}".format(openapi_url) if not openapi_url.startswith("/") else openapi_url
-    _redoc_url = "/{}".format(redoc_url) if not redoc_url.startswith("/") else redoc_url
-    _base_swagger_url = _swagger_url.rstrip("/")
-    _base_redoc_url = _redoc_url.rstrip("/")
+    def publish(tags):
+        """tags 为空时是全量生成, 否则只有这些 tag 的接口有变化"""
+        openapi_schema = docs.schema
+        # 开发模式下页面也从 openapi_url 加载文档, 不用每次重新生成内联了文档的页面
+        ui_openapi_url = _openapi_url if lean or dev else None
+        openapi_urls = None
+        tags_changed = False
+        if split_tags:
+            old_tags = list(site.tags)
+            tag_docs = split_doc_by_tags(openapi_schema, tags)
+            site.set_tag_contents({tag: dump_openapi_json(doc) for tag, doc in tag_docs.items()}, tags)
+            tags_changed = tags is None or list(site.tags) != old_tags
+            openapi_urls = [
+                {"url": "{}/{}.json".format(_base_openapi_tag_url, urllib.parse.quote(tag, safe="")), "name": tag}
+                for tag in site.tags
+            ]
+            openapi_urls.append({"url": _openapi_url, "name": "all"})
 
-    routes += [
-        tornado.web.url(_swagger_url, SwaggerHomeHandler),
-        tornado.web.url(_redoc_url, RedocHomeHandler),
-        tornado.web.url(_openapi_url, OpenapiHomeHandler),
-        tornado.web.url("{}/".format(_base_swagger_url), SwaggerHomeHandler),
-        tornado.web.url("{}/".format(_base_redoc_url), RedocHomeHandler),
-    ]
-    load_swagger_template(openapi_schema)
-    load_redoc_template(openapi_schema)
+        if lean:
+            # 只保留序列化后的内容
+            docs.release()
+        site.openapi_json = openapi_schema
+        site.set_content("openapi", docs.content)
+        # 页面中内联了文档或 tag 列表时才需要重新生成
+        if tags is None or (not ui_openapi_url and not split_tags) or tags_changed:
+            load_swagger_template(openapi_schema, static_url_prefix, ui_openapi_url, openapi_urls, site)
+        if tags is None or not ui_openapi_url:
+            load_redoc_template(openapi_schema, static_url_prefix, ui_openapi_url, site)
+        if lean:
+            site.openapi_json = None
+            site.swagger_template = ""
+            site.redoc_template = ""
 
-    OpenapiHomeHandler.OPENAPI_JSON = openapi_schema
+    docs.on_change = publish
+    if lazy:
+        site.loader = DocLoader(docs.build)
+    else:
+        docs.build()
+
+    # 兼容没有通过 initialize 传入 site 的 handler 和 api_auth
+    DocSite.DEFAULT = site
     SwaggerUser.USERNAME = login_username
     SwaggerUser.PASSWORD = login_password
+    return docs
 
 
 def load_swagger(swagger_model_path=None):
@@ -160,7 +320,13 @@ def swagger_doc(
     query_params: Type[SQuery] = None,
     header_params: Type[SHeader] = None,
     auth_required: bool = True,
+    validate: bool = False,
 ):
+    """
+    validate: 为 True 时调用方法前按 path_params/query_params/header_params/request_body 校验请求,
+        结果保存到 handler 的同名属性上, 校验失败返回 400 和错误详情
+    """
+
     def wrapper(func):
         func.__swagger__ = DocModel(
             tags=tags,
@@ -173,6 +339,8 @@ def swagger_doc(
             header_params=header_params,
             auth_required=auth_required,
         )
+        if validate:
+            return validate_request(func, func.__swagger__)
         return func
 
     return wrapper
@@ -0,0 +1,132 @@
+"""
+构建时导出文档, 生产环境直接从磁盘或 CDN 提供, 不需要在每个进程中生成
+
+    python -m swagger_doc export myapp.urls:routes --out dist/docs --yaml --compress
+"""
+
+import argparse
+import importlib
+import json
+import os
+import shutil
+import sys
+
+import tornado.web
+import yaml
+from tornado.routing import AnyMatches, Rule
+
+from . import STATIC_PATH, _generate_openapi, render_redoc_template, render_swagger_template
+from .compress import compress_variants
+
+ENCODING_SUFFIXES = {"gzip": ".gz", "br": ".br", "zstd": ".zst"}
+
+
+def load_routes(target: str):
+    """
+    module:attribute 形式, attribute 可以是路由列表, Application, 或返回两者之一的无参函数
+    """
+    module_name, _, attribute = target.partition(":")
+    if not attribute:
+        raise ValueError(f"routes should be module:attribute, got {target}")
+    obj = importlib.import_module(module_name)
+    for name in attribute.split("."):
+        obj = getattr(obj, name)
+    if callable(obj) and not isinstance(obj, tornado.web.Application):
+        obj = obj()
+    if isinstance(obj, tornado.web.Application):
+        return [Rule(AnyMatches(), obj)]
+    return list(obj)
+
+
+def write_artifact(out_dir: str, name: str, content: bytes, compress: bool):
+    with open(os.path.join(out_dir, name), "wb") as f:
+        f.write(content)
+    if not compress:
+        return
+    for encoding, encoded in compress_variants(content).items():
+        with open(os.path.join(out_dir, name + ENCODING_SUFFIXES[encoding]), "wb") as f:
+            f.write(encoded)
+
+
+def export(args):
+    routes = load_routes(args.routes)
+    openapi_schema, content = _generate_openapi(
+        routes,
+        args.cache_dir,
+        args.workers,
+        servers=json.loads(args.servers) if args.servers else None,
+        description=args.description,
+        api_version=args.api_version,
+        title=args.title,
+        contact="",
+        external_docs=None,
+        security=None,
+        use_components=args.use_components,
+    )
+
+    os.makedirs(args.out, exist_ok=True)
+    write_artifact(args.out, "openapi.json", content, args.compress)
+    if args.yaml:
+        # 使用序列化后的内容, 与 openapi.json 保持一致
+        yaml_content = yaml.safe_dump(json.loads(content), allow_unicode=True, sort_keys=False)
+        write_artifact(args.out, "openapi.yaml", yaml_content.encode("utf8"), args.compress)
+
+    if args.ui:
+        static_url_prefix = args.static_url_prefix
+        write_artifact(
+            args.out,
+            "swagger.html",
+            render_swagger_template(openapi_schema, static_url_prefix).encode("utf8"),
+            args.compress,
+        )
+        write_artifact(
+            args.out,
+            "redoc.html",
+            render_redoc_template(openapi_schema, static_url_prefix).encode("utf8"),
+            args.compress,
+        )
+        if static_url_prefix is not None:
+            # 页面引用的 js/css 一起导出, 按 static_url_prefix 部署即可
+            static_dir = os.path.join(args.out, "static")
+            for name in ("swagger_ui", "redoc_ui"):
+                shutil.copytree(
+                    os.path.join(STATIC_PATH, name),
+                    os.path.join(static_dir, name),
+                    ignore=shutil.ignore_patterns("*.jinja2", "*.gz"),
+                    dirs_exist_ok=True,
+                )
+                for file in os.listdir(os.path.join(static_dir, name)):
+                    path = os.path.join(static_dir, name, file)
+                    with open(path, "rb") as f:
+                        write_artifact(os.path.join(static_dir, name), file, f.read(), args.compress)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m swagger_doc")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="导出 openapi 文档和 swagger/redoc 页面")
+    export_parser.add_argument("routes", help="路由, module:attribute 形式, 如 myapp.urls:routes")
+    export_parser.add_argument("--out", default="swagger", help="输出目录")
+    export_parser.add_argument("--title", default="Swagger API")
+    export_parser.add_argument("--description", default="Swagger API definition")
+    export_parser.add_argument("--api-version", default="1.0.0")
+    export_parser.add_argument("--servers", help='json 格式, 如 [{"url": "https://api.example.com"}]')
+    export_parser.add_argument("--use-components", action="store_true", help="模型生成到 components/schemas 中")
+    export_parser.add_argument("--workers", type=int, default=0, help="并发生成文档的进程数")
+    export_parser.add_argument("--cache-dir", help="文档的磁盘缓存目录")
+    export_parser.add_argument("--yaml", action="store_true", help="同时导出 openapi.yaml")
+    export_parser.add_argument("--no-ui", dest="ui", action="store_false", help="不导出 swagger/redoc 页面")
+    export_parser.add_argument(
+        "--static-url-prefix", help="页面通过此地址引用 js/css, 并导出到 static 目录; 为空时内联到页面中"
+    )
+    export_parser.add_argument("--compress", action="store_true", help="同时导出压缩后的文件")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        sys.path.insert(0, os.getcwd())
+        export(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import base64
+import collections
+import concurrent.futures
+import hashlib
+import hmac
+import os
+import re
+from typing import Callable, Optional, Tuple
+
+import tornado.ioloop
+
+__all__ = ["BasicAuth", "PlainAuth", "HashedAuth", "CallbackAuth", "hash_password", "parse_basic_auth"]
+
+_BASE64_RE = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+HASH_ALGORITHM = "pbkdf2_sha256"
+
+
+def _to_bytes(value: str) -> bytes:
+    # 请求头中可能有任意字符, surrogatepass 保证编码不会失败
+    return value.encode("utf8", "surrogatepass")
+
+
+def parse_basic_auth(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """解析 Basic 认证头, 返回 (用户名, 密码), 格式不正确时返回 None, 不会抛出异常"""
+    if not header:
+        return None
+    scheme, _, value = header.strip().partition(" ")
+    value = value.strip()
+    if scheme.lower() != "basic" or len(value) % 4 or not _BASE64_RE.fullmatch(value):
+        return None
+    username, sep, password = base64.b64decode(value).decode("utf8", "replace").partition(":")
+    if not sep:
+        return None
+    return username, password
+
+
+class BasicAuth:
+    """
+    Basic 认证, 子类实现 verify 校验用户名和密码
+    最近校验通过的认证头保存在一个小的 LRU 中(只保存摘要), 之后的请求不需要再解码和校验;
+    cache_size 为 0 时不缓存, 账号可能在运行时变化的校验函数需要关闭缓存
+    """
+
+    # 是否同样缓存校验失败的认证头, 只适用于账号不会变化的校验
+    CACHE_REJECTED = False
+
+    def __init__(self, cache_size: int = 16):
+        self.cache_size = cache_size
+        self._accepted = collections.OrderedDict()
+        self._rejected = collections.OrderedDict()
+
+    def verify(self, username: str, password: str) -> bool:
+        raise NotImplementedError
+
+    def _match_header(self, header: bytes) -> bool:
+        """不需要解码就能判断的认证头"""
+        return False
+
+    def _cached(self, header: str) -> Tuple[Optional[bool], Optional[bytes]]:
+        """返回 (缓存的结果, 缓存 key), 没有缓存时结果为 None"""
+        header_bytes = _to_bytes(header)
+        if self._match_header(header_bytes):
+            return True, None
+        if not self.cache_size:
+            return None, None
+        key = hashlib.sha256(header_bytes).digest()
+        for cache, result in ((self._accepted, True), (self._rejected, False)):
+            if key in cache:
+                cache.move_to_end(key)
+                return result, key
+        return None, key
+
+    def _remember(self, key: Optional[bytes], result: bool):
+        if key is None or not (result or self.CACHE_REJECTED):
+            return
+        cache = self._accepted if result else self._rejected
+        cache[key] = None
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def check(self, header: Optional[str]) -> bool:
+        if not header:
+            return False
+        result, key = self._cached(header)
+        if result is not None:
+            return result
+        credentials = parse_basic_auth(header)
+        if credentials is None:
+            return False
+        result = self.verify(*credentials)
+        self._remember(key, result)
+        return result
+
+    async def check_async(self, header: Optional[str]) -> bool:
+        """文档 handler 中调用, 默认与 check 相同; 校验较慢的子类在线程池中校验, 不阻塞 IOLoop"""
+        return self.check(header)
+
+
+class PlainAuth(BasicAuth):
+    """明文账号密码, 预先计算好期望的认证头, 请求时直接按常数时间比较"""
+
+    def __init__(self, username: str, password: str, cache_size: int = 16):
+        super().__init__(cache_size)
+        self._username = _to_bytes(username or "")
+        self._password = _to_bytes(password or "")
+        self._expected = b"Basic " + base64.b64encode(self._username + b":" + self._password)
+
+    def _match_header(self, header: bytes) -> bool:
+        return hmac.compare_digest(header, self._expected)
+
+    def verify(self, username: str, password: str) -> bool:
+        # 两项都要比较, 耗时与哪一项不匹配无关
+        username_ok = hmac.compare_digest(_to_bytes(username), self._username)
+        password_ok = hmac.compare_digest(_to_bytes(password), self._password)
+        return username_ok and password_ok
+
+
+def hash_password(password: str, iterations: int = 10000, salt: str = None) -> str:
+    """
+    生成 HashedAuth 使用的密码摘要: pbkdf2_sha256$迭代次数$盐$摘要
+    每次校验都要按迭代次数重新计算摘要, 默认的 10000 次约 5ms, 每增加 10 万次约增加 50ms CPU 时间
+    """
+    salt = salt or os.urandom(16).hex()
+    digest = hashlib.pbkdf2_hmac("sha256", _to_bytes(password), _to_bytes(salt), iterations).hex()
+    return "{}${}${}${}".format(HASH_ALGORITHM, iterations, salt, digest)
+
+
+class HashedAuth(BasicAuth):
+    """
+    只保存密码摘要(hash_password 的返回值), 配置中不需要出现明文密码
+    摘要计算较慢: check_async 在线程池中计算, 同时等待计算的请求超过 max_pending 时直接拒绝;
+    校验通过和失败的认证头都会被缓存, 同一个错误的认证头不会重复计算
+    """
+
+    CACHE_REJECTED = True
+    _executor = None
+
+    def __init__(self, username: str, password_hash: str, cache_size: int = 16, max_pending: int = 4):
+        super().__init__(cache_size)
+        algorithm, iterations, salt, digest = password_hash.split("$")
+        if algorithm != HASH_ALGORITHM:
+            raise ValueError(f"unsupported password hash: {algorithm}")
+        self._username = _to_bytes(username)
+        self._iterations = int(iterations)
+        self._salt = _to_bytes(salt)
+        self._digest = bytes.fromhex(digest)
+        self.max_pending = max_pending
+        self._pending = 0
+
+    @staticmethod
+    def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+        # pbkdf2_hmac 计算时释放 GIL, 少量线程即可
+        if HashedAuth._executor is None:
+            HashedAuth._executor = concurrent.futures.ThreadPoolExecutor(2, thread_name_prefix="swagger-doc-auth")
+        return HashedAuth._executor
+
+    def verify(self, username: str, password: str) -> bool:
+        digest = hashlib.pbkdf2_hmac("sha256", _to_bytes(password), self._salt, self._iterations)
+        username_ok = hmac.compare_digest(_to_bytes(username), self._username)
+        return hmac.compare_digest(digest, self._digest) and username_ok
+
+    async def check_async(self, header: Optional[str]) -> bool:
+        if not header:
+            return False
+        result, key = self._cached(header)
+        if result is not None:
+            return result
+        credentials = parse_basic_auth(header)
+        if credentials is None or self._pending >= self.max_pending:
+            return False
+
+        self._pending += 1
+        try:
+            result = await tornado.ioloop.IOLoop.current().run_in_executor(
+                self._get_executor(), self.verify, *credentials
+            )
+        finally:
+            self._pending -= 1
+        self._remember(key, result)
+        return result
+
+
+class CallbackAuth(BasicAuth):
+    """callback(用户名, 密码) 返回是否通过, 例如查询数据库或 LDAP"""
+
+    def __init__(self, callback: Callable[[str, str], bool], cache_size: int = 16):
+        super().__init__(cache_size)
+        self.callback = callback
+
+    def verify(self, username: str, password: str) -> bool:
+        return bool(self.callback(username, password))
@@ -1,16 +1,21 @@
 import collections
+import concurrent.futures
+import functools
 import logging
+import multiprocessing
 import os
-import queue
-import re
 import typing
 from inspect import getfullargspec
 
+import tornado.util
 import tornado.web
 import yaml
 from jinja2 import BaseLoader
 from jinja2 import Environment
-from tornado.web import URLSpec
+from tornado.routing import Matcher, PathMatches, Rule, RuleRouter
+
+from .models import SchemaRegistry, clear_schema_cache
+from .utils import copy_tree
 
 if typing.TYPE_CHECKING:
     from .models import SSecurity, DocModel
@@ -20,15 +25,18 @@ replace_symbols = {"/", "$", "(", ")", "{", "}"}
 replace_map = {ord(k): v for k, v in dict(zip(replace_symbols, ["_"] * len(replace_symbols))).items()}
 
 
-def build_doc_from_func_doc(handler, route_path, security: "SSecurity"):
+def build_doc_from_func_doc(handler, route_path, security: "SSecurity", registry: SchemaRegistry = None):
     out = {}
 
     for method in handler.SUPPORTED_METHODS:
         method = method.lower()
         swagger: "DocModel" = getattr(getattr(handler, method), "__swagger__", None)
         if swagger:
-            d = swagger.gen_doc()
-            d["operationId"] = f"{method}_{handler.__name__}_{route_path.translate(replace_map)}"
+            # gen_doc 的结果是缓存共享的, 每个路由的 operationId/security 浅拷贝后覆盖
+            d = {
+                **swagger.gen_doc(registry),
+                "operationId": f"{method}_{handler.__name__}_{route_path.translate(replace_map)}",
+            }
             if swagger.auth_required and security:
                 d["security"] = security.get_security()
             out.update({method: d})
@@ -36,6 +44,16 @@ def build_doc_from_func_doc(handler, route_path, security: "SSecurity"):
     return out
 
 
+def release_doc_caches(routes):
+    """释放生成文档时缓存的接口文档和模型 schema, 之后需要时重新生成"""
+    for handler, _ in iter_routes(routes):
+        for method in handler.SUPPORTED_METHODS:
+            swagger: "DocModel" = getattr(getattr(handler, method.lower()), "__swagger__", None)
+            if swagger:
+                swagger._doc_cache = None
+    clear_schema_cache()
+
+
 def try_extract_docs(method_handler):
     try:
         if hasattr(method_handler, "__wrapped__"):
@@ -45,35 +63,283 @@ def try_extract_docs(method_handler):
         return []
 
 
+@functools.lru_cache(maxsize=None)
+def _handler_method_args(handler) -> tuple:
+    """每个 handler 类只解析一次各请求方法的参数名"""
+    ret = []
+    for method in handler.SUPPORTED_METHODS:
+        args = try_extract_docs(getattr(handler, method.lower()))
+        if args:
+            ret.append((method, tuple(args)))
+    return tuple(ret)
+
+
 def extract_parameters_names(handler, parameters_count):
     if parameters_count == 0:
         return []
 
     parameters = ["{?}" for _ in range(parameters_count)]
 
-    for method in handler.SUPPORTED_METHODS:
-        method_handler = getattr(handler, method.lower())
-        args = try_extract_docs(method_handler)
-
-        if len(args) > 0:
-            for i, arg in enumerate(args):
-                if set(arg) != {"_"}:
-                    try:
-                        parameters[i] = arg
-                    except:
-                        logging.warning(f"{handler.__name__} {method} 参数传递有误")
+    for method, args in _handler_method_args(handler):
+        for i, arg in enumerate(args):
+            if set(arg) != {"_"}:
+                try:
+                    parameters[i] = arg
+                except:
+                    logging.warning(f"{handler.__name__} {method} 参数传递有误")
 
     return parameters
 
 
+def _scan_group_prefix(pattern: str, i: int):
+    """
+    解析 pattern[i] 处 "(" 开始的分组, 返回 (前缀长度, 是否捕获组, 组名)
+    """
+    if not pattern.startswith("?", i + 1):
+        return 1, True, None
+    if pattern.startswith("?P<", i + 1):
+        end = pattern.index(">", i)
+        return end - i + 1, True, pattern[i + 4 : end]
+    # (?:...) (?=...) (?!...) (?<=...) (?<!...) (?P=name) (?#...) (?i) 等都不是捕获组
+    return 2, False, None
+
+
+@functools.lru_cache(maxsize=None)
+def parse_route_pattern(pattern: str) -> tuple:
+    """
+    把路由正则拆分成片段: 普通文本为 str, 最外层的捕获组为 (组序号, 组名)
+    组序号按 Tornado 传参的顺序计算, 嵌套在捕获组内的分组也会占用序号
+    转义字符, 字符集中的括号和非捕获组都不会被当作参数
+    """
+    parts = []
+    text = []
+    stack = []
+    capture_depth = 0
+    group_index = 0
+    i, n = 0, len(pattern)
+
+    while i < n:
+        char = pattern[i]
+        if char == "\\":
+            token, i = pattern[i : i + 2], i + 2
+        elif char == "[":
+            end = i + 1
+            if pattern.startswith("^", end):
+                end += 1
+            if pattern.startswith("]", end):
+                end += 1
+            while end < n and pattern[end] != "]":
+                end += 2 if pattern[end] == "\\" else 1
+            token, i = pattern[i : end + 1], end + 1
+        elif char == "(":
+            if pattern.startswith("?#", i + 1):
+                i = pattern.index(")", i) + 1
+                continue
+            length, capturing, name = _scan_group_prefix(pattern, i)
+            token, i = pattern[i : i + length], i + length
+            stack.append(capturing)
+            if capturing:
+                if capture_depth == 0:
+                    if text:
+                        parts.append("".join(text))
+                        text = []
+                    parts.append((group_index, name))
+                capture_depth += 1
+                group_index += 1
+                continue
+        elif char == ")" and stack:
+            token, i = char, i + 1
+            if stack.pop():
+                capture_depth -= 1
+                continue
+        else:
+            token, i = char, i + 1
+
+        if capture_depth == 0:
+            text.append(token)
+
+    if text:
+        parts.append("".join(text))
+    return tuple(parts)
+
+
 def format_handler_path(target, route_pattern, groups):
-    brackets_regex = re.compile(r"\(.*?\)")
     parameters = extract_parameters_names(target, groups)
 
-    for i, entity in enumerate(brackets_regex.findall(route_pattern)):
-        route_pattern = route_pattern.replace(entity, "{%s}" % parameters[i], 1)
+    path = "".join(
+        part if isinstance(part, str) else "{%s}" % (part[1] or parameters[part[0]])
+        for part in parse_route_pattern(route_pattern)
+    )
+    return path[:-1] if path.endswith("$") else path
+
+
+@functools.lru_cache(maxsize=None)
+def _path_matcher(pattern: str) -> PathMatches:
+    return PathMatches(pattern)
+
+
+def _iter_route_matchers(routes):
+    """按广度优先遍历路由表, 返回 (handler 类, Matcher 或元组形式路由中的 pattern 字符串)"""
+    pending = collections.deque(routes)
+    seen_routers = set()
+
+    while pending:
+        item = pending.popleft()
+        if isinstance(item, Rule):
+            matcher, target = item.matcher, item.target
+        elif isinstance(item, tuple) and len(item) >= 2:
+            matcher, target = item[0], item[1]
+            if not isinstance(matcher, (str, Matcher)):
+                raise ValueError(f"Unknown route: {item}")
+        else:
+            raise ValueError(f"Unknown route: {item}")
+
+        if not target:
+            continue
+        # 与 Tornado 的 Rule 一致, 字符串形式的 handler 按模块路径导入
+        if isinstance(target, str):
+            target = tornado.util.import_object(target)
+
+        # 嵌套的路由, Tornado 中嵌套路由匹配的是完整路径, 不需要拼接前缀
+        if isinstance(target, (list, tuple)):
+            pending.extend(target)
+            continue
+        if isinstance(target, (RuleRouter, tornado.web.Application)):
+            if id(target) in seen_routers:
+                continue
+            seen_routers.add(id(target))
+            if isinstance(target, tornado.web.Application):
+                target = target.default_router
+            pending.extend(target.rules)
+            continue
+
+        if not isinstance(target, type) or not issubclass(target, tornado.web.RequestHandler):
+            continue
+        yield target, matcher
+
 
-    return route_pattern[:-1]
+def iter_routes(routes):
+    """
+    按广度优先遍历路由表, 返回 (handler, 路径正则)
+    支持 URLSpec/Rule, (pattern, target, ...) 元组, 嵌套的列表, RuleRouter 和 Application
+    Rule 的正则直接复用, 元组形式的 pattern 只编译一次
+    """
+    for target, matcher in _iter_route_matchers(routes):
+        if isinstance(matcher, str):
+            matcher = _path_matcher(matcher)
+        # 只有路径匹配才能生成文档
+        if isinstance(matcher, PathMatches):
+            yield target, matcher.regex
+
+
+def iter_route_patterns(routes):
+    """同 iter_routes, 返回路由正则的字符串, 元组形式的 pattern 不需要编译"""
+    for target, matcher in _iter_route_matchers(routes):
+        if isinstance(matcher, str):
+            yield target, matcher
+        elif isinstance(matcher, PathMatches):
+            yield target, matcher.regex.pattern
+
+
+def _build_route_doc(target, pattern: str, security) -> tuple:
+    regex = _path_matcher(pattern).regex
+    route_path = format_handler_path(target, regex.pattern, regex.groups)
+    return route_path, build_doc_from_func_doc(target, route_path, security)
+
+
+# workers 模式下 fork 出的子进程通过下标读取 (路由, security), 不需要序列化 handler
+_FORK_STATE = None
+
+
+def _build_docs_chunk(start, end, use_components):
+    items, security = _FORK_STATE
+    registry = SchemaRegistry() if use_components else None
+    docs = [build_doc_from_func_doc(target, route_path, security, registry) for target, route_path in items[start:end]]
+    return docs, registry.export() if registry is not None else []
+
+
+def _build_docs_parallel(items, security, registry, workers):
+    """
+    把路由分段后在进程池中并发生成, 再按路由顺序合并, 结果与顺序生成的完全一致
+    """
+    global _FORK_STATE
+
+    chunk_size = max(1, -(-len(items) // (workers * 4)))
+    _FORK_STATE = (items, security)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            futures = [
+                executor.submit(_build_docs_chunk, start, start + chunk_size, registry is not None)
+                for start in range(0, len(items), chunk_size)
+            ]
+            docs = []
+            for future in futures:
+                chunk_docs, schemas = future.result()
+                if registry is not None:
+                    rename = registry.merge(schemas)
+                    chunk_docs = [SchemaRegistry.rename_refs(doc, rename) for doc in chunk_docs]
+                docs.extend(chunk_docs)
+            return docs
+    finally:
+        _FORK_STATE = None
+
+
+def _iter_refs(obj):
+    if isinstance(obj, dict):
+        ref = obj.get("$ref")
+        if isinstance(ref, str):
+            yield ref
+        for value in obj.values():
+            yield from _iter_refs(value)
+    elif isinstance(obj, list):
+        for value in obj:
+            yield from _iter_refs(value)
+
+
+def _referenced_schemas(operations, schemas) -> dict:
+    """operations 直接或间接引用到的 components/schemas"""
+    ret = {}
+    pending = list(_iter_refs(operations))
+    while pending:
+        ref = pending.pop()
+        if not ref.startswith(SchemaRegistry.REF_PREFIX):
+            continue
+        name = ref[len(SchemaRegistry.REF_PREFIX) :]
+        if name in ret or name not in schemas:
+            continue
+        ret[name] = schemas[name]
+        pending.extend(_iter_refs(schemas[name]))
+    return {name: schemas[name] for name in schemas if name in ret}
+
+
+def operation_tags(operation) -> list:
+    return operation.get("tags") or ["default"]
+
+
+def split_doc_by_tags(swagger, tags=None) -> dict:
+    """
+    按接口的 tags 拆分文档, 返回 {tag: 文档}, 没有 tag 的接口归到 default
+    每个文档只包含该 tag 的接口和它们引用到的 components/schemas
+    tags 不为空时只生成这些 tag 的文档
+    """
+    tag_paths = collections.defaultdict(lambda: collections.defaultdict(dict))
+    for route_path, operations in swagger["paths"].items():
+        for method, operation in operations.items():
+            for tag in operation_tags(operation):
+                if tags is None or tag in tags:
+                    tag_paths[tag][route_path][method] = operation
+
+    components = swagger.get("components") or {}
+    schemas = components.get("schemas") or {}
+    ret = {}
+    for tag, paths in tag_paths.items():
+        doc = {**swagger, "paths": dict(paths)}
+        if schemas:
+            doc["components"] = {**components, "schemas": _referenced_schemas(doc["paths"], schemas)}
+        ret[tag] = doc
+    return ret
 
 
 def dict2yaml(d, indent=10, result=""):
@@ -95,7 +361,59 @@ def generate_doc_from_endpoints(
     contact,
     external_docs,
     security: "SSecurity",
+    use_components: bool = False,
+    workers: int = 0,
+    registry: SchemaRegistry = None,
+    operation_cache=None,
+    shared=None,
 ):
+    """
+    参数见 _build_openapi
+    模型和接口的 schema 是缓存共享的, 返回的是独立的副本, 调用方可以随意修改
+    """
+    return copy_tree(
+        _build_openapi(
+            routes,
+            servers,
+            description,
+            api_version,
+            title,
+            contact,
+            external_docs,
+            security,
+            use_components=use_components,
+            workers=workers,
+            registry=registry,
+            operation_cache=operation_cache,
+            shared=shared,
+        )
+    )
+
+
+def _build_openapi(
+    routes,
+    servers,
+    description,
+    api_version,
+    title,
+    contact,
+    external_docs,
+    security: "SSecurity",
+    use_components: bool = False,
+    workers: int = 0,
+    registry: SchemaRegistry = None,
+    operation_cache=None,
+    shared=None,
+):
+    """
+    use_components: 为 True 时模型只在 components/schemas 中生成一次, 其他地方通过 $ref 引用
+    workers: 大于 1 时在 fork 出的进程池中并发生成各接口的文档, 结果与顺序生成的完全一致
+    registry: use_components 时使用的 SchemaRegistry, 为空时新建
+    operation_cache: 按接口缓存文档的 OperationCache, 只在不使用 components 时生效
+    shared: 多套文档共享的 SharedSpecs, 设置后使用它的 SchemaRegistry 并复用已经生成的接口文档,
+        components/schemas 只包含本文档引用到的模型
+    返回的文档中有缓存共享的对象, 只用于序列化, 不能修改
+    """
     # Clean description
     _start_desc = 0
     for i, word in enumerate(description):
@@ -126,34 +444,45 @@ def generate_doc_from_endpoints(
 
     if security:
         swagger["components"]["securitySchemes"] = security.get_security_schema()
-
-    q = queue.Queue()
-    for route in routes:
-        q.put(route)
-
-    while not q.empty():
-        item = q.get()
-        if isinstance(item, URLSpec):
-            route = item
-        elif isinstance(item, tuple):
-            _, left = item
-            if isinstance(left, list):
-                for item in left:
-                    q.put(item)
-                continue
-            else:
-                route = tornado.web.url(*item)
+    if shared is not None:
+        registry = shared.schema_registry
+    elif use_components and registry is None:
+        registry = SchemaRegistry()
+    elif not use_components:
+        registry = None
+
+    if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        logging.warning("fork is not supported on this platform, generate docs sequentially")
+        workers = 0
+
+    if operation_cache is not None and registry is None:
+        # 命中缓存的接口不需要编译路由正则和解析参数名
+        items, docs = [], []
+        for target, pattern in iter_route_patterns(routes):
+            route_path, doc = operation_cache.get(
+                target, pattern, functools.partial(_build_route_doc, target, pattern, security)
+            )
+            items.append((target, route_path))
+            docs.append(doc)
+    else:
+        items = [
+            (target, format_handler_path(target, regex.pattern, regex.groups)) for target, regex in iter_routes(routes)
+        ]
+        if shared is not None:
+            docs = [shared.operation(target, route_path, security) for target, route_path in items]
+        elif workers > 1 and len(items) > 1:
+            docs = _build_docs_parallel(items, security, registry, workers)
         else:
-            raise ValueError(f"Unknown route: {item}")
+            docs = [build_doc_from_func_doc(target, route_path, security, registry) for target, route_path in items]
 
-        target = route.target
-        if not target:
-            continue
-
-        route_path = format_handler_path(target, route.regex.pattern, route.regex.groups)
-        doc = build_doc_from_func_doc(target, route_path, security)
+    for (_, route_path), doc in zip(items, docs):
         if not doc:
             continue
         swagger["paths"][route_path].update(doc)
 
+    if shared is not None:
+        swagger["components"]["schemas"] = _referenced_schemas(swagger["paths"], registry.schemas)
+    elif registry is not None:
+        swagger["components"]["schemas"] = registry.schemas
+
     return swagger
@@ -0,0 +1,230 @@
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import typing
+from enum import Enum
+from typing import Optional
+
+from pydantic import BaseModel
+
+from .builders import _handler_method_args, iter_routes
+
+if typing.TYPE_CHECKING:
+    from .models import DocModel
+
+CACHE_FILE_TEMPLATE = "openapi-{}.json"
+OPERATION_CACHE_FILE_TEMPLATE = "operations-{}.pickle"
+
+
+def _iter_model_classes(annotation, seen: set):
+    """模型及其字段中引用到的所有模型/枚举类, 包括模型的父类, 父类中的字段定义变化也会影响文档"""
+    if isinstance(annotation, type) and issubclass(annotation, (BaseModel, Enum)):
+        if annotation in seen:
+            return
+        seen.add(annotation)
+        yield annotation
+        if issubclass(annotation, BaseModel):
+            for base in annotation.__mro__[1:]:
+                if base is not BaseModel and isinstance(base, type) and issubclass(base, BaseModel):
+                    yield from _iter_model_classes(base, seen)
+            for field in annotation.model_fields.values():
+                yield from _iter_model_classes(field.annotation, seen)
+        return
+    for arg in typing.get_args(annotation):
+        yield from _iter_model_classes(arg, seen)
+
+
+@functools.lru_cache(maxsize=None)
+def _class_source_hash(cls) -> str:
+    try:
+        source = inspect.getsource(cls)
+    except (OSError, TypeError):
+        # 动态生成的类没有源码, 用生成的 schema 代替
+        if issubclass(cls, BaseModel):
+            source = json.dumps(cls.model_json_schema(), sort_keys=True)
+        else:
+            source = repr([(i.name, i.value) for i in cls])
+    return hashlib.sha1(source.encode("utf8")).hexdigest()
+
+
+def _model_fingerprint(model) -> list:
+    if model is None:
+        return []
+    return [
+        [cls.__module__, cls.__qualname__, _class_source_hash(cls), repr(getattr(cls, "__example__", None))]
+        for cls in _iter_model_classes(model, set())
+    ]
+
+
+def _doc_fingerprint(doc: "DocModel") -> list:
+    return [
+        [i.value if isinstance(i, Enum) else i for i in doc.tags],
+        doc.summary,
+        doc.desc,
+        doc.auth_required,
+        [[i.status_code, i.description, _model_fingerprint(i.body)] for i in doc.responses],
+        _model_fingerprint(doc.request_body),
+        _model_fingerprint(doc.path_params),
+        _model_fingerprint(doc.query_params),
+        _model_fingerprint(doc.header_params),
+    ]
+
+
+def _route_fingerprint(handler, pattern: str) -> list:
+    methods = []
+    for method in handler.SUPPORTED_METHODS:
+        doc = getattr(getattr(handler, method.lower()), "__swagger__", None)
+        if doc is not None:
+            methods.append([method, _doc_fingerprint(doc)])
+    return [handler.__module__, handler.__qualname__, pattern, _handler_method_args(handler), methods]
+
+
+def _options_hasher(version: str, **options):
+    hasher = hashlib.sha256()
+    hasher.update(version.encode("utf8"))
+    for key, value in sorted(options.items()):
+        if isinstance(value, BaseModel):
+            value = value.model_dump(mode="json", by_alias=True)
+        hasher.update(json.dumps([key, value], sort_keys=True, default=repr).encode("utf8"))
+    return hasher
+
+
+def spec_fingerprint(routes, version: str, **options) -> str:
+    """
+    根据路由, handler 上的 DocModel, 模型类的源码, 生成参数和库版本计算文档的指纹
+    任意一项变化都会得到不同的指纹
+    """
+    hasher = _options_hasher(version, **options)
+    for handler, regex in iter_routes(routes):
+        hasher.update(json.dumps(_route_fingerprint(handler, regex.pattern), default=repr).encode("utf8"))
+    return hasher.hexdigest()
+
+
+def load_cached_spec(cache_dir: str, fingerprint: str) -> Optional[bytes]:
+    try:
+        with open(os.path.join(cache_dir, CACHE_FILE_TEMPLATE.format(fingerprint)), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _write_atomic(path: str, content: bytes):
+    """先写临时文件再 rename, 多个进程同时写入也不会读到不完整的文件"""
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".openapi-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def store_cached_spec(cache_dir: str, fingerprint: str, content: bytes):
+    _write_atomic(os.path.join(cache_dir, CACHE_FILE_TEMPLATE.format(fingerprint)), content)
+
+
+# 这些模块中的类只会随依赖版本变化, 不需要检查修改时间
+_STABLE_MODULES = {"builtins", "enum", "abc", "typing"}
+
+
+@functools.lru_cache(maxsize=None)
+def _class_modules(cls) -> tuple:
+    return tuple(dict.fromkeys(i.__module__ for i in cls.__mro__ if i.__module__ not in _STABLE_MODULES))
+
+
+@functools.lru_cache(maxsize=None)
+def _model_modules(model) -> tuple:
+    """模型及其字段中引用到的所有类(包括父类)所在的模块"""
+    modules = {}
+    for cls in _iter_model_classes(model, set()):
+        modules.update(dict.fromkeys(_class_modules(cls)))
+    return tuple(modules)
+
+
+@functools.lru_cache(maxsize=None)
+def _handler_modules(handler) -> tuple:
+    """handler 及其文档中引用到的所有类(包括父类)所在的模块"""
+    modules = dict.fromkeys(_class_modules(handler))
+    for method in handler.SUPPORTED_METHODS:
+        doc = getattr(getattr(handler, method.lower()), "__swagger__", None)
+        if doc is None:
+            continue
+        models = [i.body for i in doc.responses]
+        models += [doc.request_body, doc.path_params, doc.query_params, doc.header_params]
+        for model in models:
+            if model is not None:
+                modules.update(dict.fromkeys(_model_modules(model)))
+    return tuple(modules)
+
+
+class OperationCache:
+    """
+    开发模式下按接口缓存生成的文档, 进程重启后 handler 和模型所在模块的修改时间都没有变化的接口直接复用
+    库版本和生成参数变化时整个缓存失效
+    缓存用 pickle 保存, 各接口共享的模型文档只保存一份, 读取很快; 缓存目录需要是只有当前用户可写的目录
+    """
+
+    def __init__(self, cache_dir: str, version: str, **options):
+        self.path = os.path.join(
+            cache_dir, OPERATION_CACHE_FILE_TEMPLATE.format(_options_hasher(version, **options).hexdigest())
+        )
+        try:
+            with open(self.path, "rb") as f:
+                self._entries = pickle.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+        except Exception:
+            # 缓存损坏或者引用的类已经不存在
+            logging.warning(f"invalid operation cache {self.path}, ignored")
+            self._entries = {}
+        self._used = {}
+        self._mtimes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _module_mtime(self, module_name: str):
+        mtime = self._mtimes.get(module_name, ())
+        if mtime == ():
+            module = sys.modules.get(module_name)
+            try:
+                mtime = os.stat(module.__file__).st_mtime_ns
+            except (AttributeError, TypeError, OSError):
+                # 内置模块或动态生成的模块
+                mtime = None
+            self._mtimes[module_name] = mtime
+        return mtime
+
+    def _stamp(self, handler) -> tuple:
+        return tuple((module, self._module_mtime(module)) for module in _handler_modules(handler))
+
+    def get(self, handler, pattern: str, build):
+        """读取接口的 (路径, 文档), 没有缓存或已过期时调用 build 生成"""
+        key = "{}.{} {}".format(handler.__module__, handler.__qualname__, pattern)
+        stamp = self._stamp(handler)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == stamp and None not in (i[1] for i in stamp):
+            self.hits += 1
+            ret = entry[1]
+        else:
+            self.misses += 1
+            ret = build()
+        self._used[key] = (stamp, ret)
+        return ret
+
+    def save(self):
+        """只保存本次用到的接口, 已删除的路由不会一直留在缓存中, 没有变化时不写入"""
+        changed = self.misses > 0 or self._used.keys() != self._entries.keys()
+        self._entries = self._used
+        self._used = {}
+        if changed:
+            _write_atomic(self.path, pickle.dumps(self._entries, protocol=pickle.HIGHEST_PROTOCOL))
@@ -0,0 +1,74 @@
+import gzip
+from typing import Dict, Iterable, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# python3.14+ 标准库的 compression.zstd 与 zstandard 的接口不同
+try:
+    from compression import zstd
+
+    ZSTD_STDLIB = True
+except ImportError:
+    ZSTD_STDLIB = False
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+# 同等支持时优先使用压缩率更高的编码
+ENCODING_PREFERENCE = ("zstd", "br", "gzip")
+
+
+def _zstd_compress(content: bytes) -> bytes:
+    if ZSTD_STDLIB:
+        # 一次性压缩, 输出完整的 frame
+        return zstd.compress(content, level=zstd.CompressionParameter.compression_level.bounds()[1])
+    return zstd.ZstdCompressor(level=zstd.MAX_COMPRESSION_LEVEL).compress(content)
+
+
+def compress_variants(content: bytes) -> Dict[str, bytes]:
+    """以最高压缩级别生成各编码的内容, gzip 始终可用, br/zstd 仅在安装了对应模块时生成"""
+    variants = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(content, quality=11)
+    if zstd is not None:
+        variants["zstd"] = _zstd_compress(content)
+    # 压缩后没有变小的没有必要返回
+    return {k: v for k, v in variants.items() if len(v) < len(content)}
+
+
+def parse_accept_encoding(accept_encoding: str) -> Dict[str, float]:
+    ret = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        ret[coding] = q
+    return ret
+
+
+def select_encoding(accept_encoding: Optional[str], available: Iterable[str]) -> Optional[str]:
+    """根据 Accept-Encoding 选择已有的压缩编码, 返回 None 表示使用原始内容"""
+    if not accept_encoding:
+        return None
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in ENCODING_PREFERENCE:
+        if coding not in available:
+            continue
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
@@ -1,17 +1,35 @@
-import base64
+import datetime
+import email.utils
 import functools
-import json
+import hashlib
+import inspect
+import logging
+import mimetypes
+import mmap
+import os
+import random
+import threading
+from typing import Dict
 
+import tornado.iostream
 import tornado.web
 
-from .utils import CJsonEncoder
+from .auth import BasicAuth, CallbackAuth, PlainAuth
+from .compress import compress_variants, select_encoding
+from .validation import RESPONSE_CHECKER
 
 __all__ = [
     "TornadoHandler",
     "SwaggerHomeHandler",
     "RedocHomeHandler",
     "OpenapiHomeHandler",
+    "SwaggerStaticHandler",
     "SwaggerUser",
+    "DocHomeHandler",
+    "DocLoader",
+    "OpenapiTagHandler",
+    "DocSite",
+    "DocContent",
 ]
 
 
@@ -26,7 +44,15 @@ def api_auth(username, password):
     return False
 
 
-def basic_auth(auth):
+def basic_auth(auth=None):
+    """
+    auth: BasicAuth 或校验 (用户名, 密码) 的函数, 为空时使用 handler.get_basic_auth()
+    认证头缺失或格式不正确时返回 401
+    """
+    if auth is not None and not isinstance(auth, BasicAuth):
+        # 函数的结果可能随时变化(例如 api_auth), 不缓存
+        auth = CallbackAuth(auth, cache_size=0)
+
     def decorator(f):
         def _request_auth(handler):
             handler.set_header("WWW-Authenticate", "Basic realm=JSL")
@@ -34,22 +60,15 @@ def basic_auth(auth):
             handler.finish()
 
         @functools.wraps(f)
-        def new_f(*args):
+        async def new_f(*args):
             handler = args[0]
-
-            auth_header = handler.request.headers.get("Authorization")
-            if auth_header is None:
+            checker = auth or handler.get_basic_auth()
+            if checker is None or not await checker.check_async(handler.request.headers.get("Authorization")):
                 return _request_auth(handler)
-            if not auth_header.startswith("Basic "):
-                return _request_auth(handler)
-
-            auth_decoded = base64.decodebytes(auth_header[6:].encode("utf8")).decode("utf8")
-            username, password = auth_decoded.split(":", 2)
-
-            if auth(username, password):
-                f(*args)
-            else:
-                _request_auth(handler)
+            ret = f(*args)
+            if inspect.isawaitable(ret):
+                ret = await ret
+            return ret
 
         return new_f
 
@@ -57,30 +76,264 @@ def basic_auth(auth):
 
 
 class TornadoHandler(tornado.web.RequestHandler):
+    # 抽样校验响应是否符合文档的比例(0~1), 为 0 时不做任何校验
+    RESPONSE_SAMPLE_RATE = 0
+    RESPONSE_CHECKER = RESPONSE_CHECKER
+
     def data_received(self, chunk):
         pass
 
+    def finish(self, chunk=None):
+        if self.RESPONSE_SAMPLE_RATE and random.random() < self.RESPONSE_SAMPLE_RATE:
+            chunk = self._check_response(chunk)
+        return super().finish(chunk)
+
+    def _check_response(self, chunk):
+        # 已经 flush 过的响应拿不到完整内容
+        if self._finished or self._headers_written:
+            return chunk
+        if chunk is not None:
+            self.write(chunk)
+        try:
+            self.RESPONSE_CHECKER.check(self, b"".join(self._write_buffer))
+        except Exception:
+            logging.exception("check response failed")
+        return None
+
+
+class DocLoader:
+    """延迟生成文档, 第一次访问文档时在锁内生成一次"""
+
+    def __init__(self, load):
+        self._load = load
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self._lock:
+            if not self.loaded:
+                self._load()
+                self.loaded = True
+
+
+class DocContent:
+    """序列化后的文档, 内容的各压缩版本, etag 和 last-modified 都预先计算好"""
+
+    def __init__(self, content: bytes = b"", compress: bool = True):
+        self.content = content
+        # {content-coding: 压缩后的内容}
+        self.encoded = compress_variants(content) if compress and content else {}
+        self.etag = hashlib.sha1(content).hexdigest() if content else None
+        self.last_modified = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+
+class DocSite:
+    """
+    一套文档的内容和配置, setup_swagger 每次调用创建一个, 通过 initialize 参数传给文档 handler,
+    同一个进程中的多套文档互不影响
+    """
+
+    # 没有通过 initialize 传入 site 的 handler 使用最近一次 setup_swagger 的 site
+    DEFAULT = None
+
+    def __init__(self, username: str = None, password: str = None, compress: bool = True, auth=None):
+        """auth: BasicAuth 或校验 (用户名, 密码) 的函数, 为空时使用 username/password, 都为空时拒绝所有请求"""
+        if auth is None and username is not None:
+            auth = PlainAuth(username, password)
+        elif auth is not None and not isinstance(auth, BasicAuth):
+            auth = CallbackAuth(auth)
+        self.auth = auth
+        # 开发模式下不预先压缩, 减少每次重启生成文档的耗时
+        self.compress = compress
+        # lazy 模式下的 DocLoader
+        self.loader = None
+        self.openapi_json = None
+        self.swagger_template = ""
+        self.redoc_template = ""
+        self.openapi = DocContent()
+        self.swagger = DocContent()
+        self.redoc = DocContent()
+        # {tag: DocContent}
+        self.tags = {}
+
+    def set_content(self, name: str, content: bytes):
+        """name: openapi/swagger/redoc"""
+        setattr(self, name, DocContent(content, self.compress))
+
+    def set_tag_contents(self, contents: Dict[str, bytes], tags=None):
+        """tags 不为空时只更新这些 tag, contents 中没有的 tag 会被删除"""
+        if tags is None:
+            self.tags = {tag: DocContent(content, self.compress) for tag, content in contents.items()}
+            return
+        # 复制后整体替换, 不影响正在处理的请求
+        tag_contents = dict(self.tags)
+        for tag in tags:
+            if tag in contents:
+                tag_contents[tag] = DocContent(contents[tag], self.compress)
+            else:
+                tag_contents.pop(tag, None)
+        self.tags = tag_contents
+
+
+DocSite.DEFAULT = DocSite()
+
+
+class DocHomeHandler(TornadoHandler):
+    """
+    文档内容只在生成文档时变化, 请求时按 Accept-Encoding 直接返回预先压缩的内容, 支持条件请求
+    内容按 CHUNK_SIZE 分块写出并 flush, 每个请求的输出缓冲不会超过一个分块
+    """
 
-class SwaggerHomeHandler(TornadoHandler):
-    SWAGGER_HOME_TEMPLATE = ""
+    CHUNK_SIZE = 64 * 1024
+    # 返回 DocSite 中的哪份内容
+    CONTENT_NAME = None
 
-    @basic_auth(api_auth)
-    def get(self):
-        self.write(self.SWAGGER_HOME_TEMPLATE)
+    def initialize(self, site: DocSite = None):
+        self.site = site or DocSite.DEFAULT
+        self.doc_content = None
 
+    def get_basic_auth(self) -> BasicAuth:
+        return self.site.auth
 
-class RedocHomeHandler(TornadoHandler):
-    REDOC_HOME_TEMPLATE = ""
+    def get_doc_content(self) -> DocContent:
+        return getattr(self.site, self.CONTENT_NAME)
 
-    @basic_auth(api_auth)
-    def get(self):
-        self.write(self.REDOC_HOME_TEMPLATE)
+    def compute_etag(self):
+        if self.doc_content is None or self.doc_content.etag is None:
+            return None
+        encoding = self._headers.get("Content-Encoding")
+        # 不同编码是不同的表示, 需要不同的强 etag
+        etag = self.doc_content.etag
+        return '"%s-%s"' % (etag, encoding) if encoding else '"%s"' % etag
 
+    def check_not_modified(self) -> bool:
+        """设置缓存校验头, 客户端缓存有效时返回 True"""
+        if self.doc_content.etag is None:
+            return False
+        self.set_etag_header()
+        self.set_header("Last-Modified", self.doc_content.last_modified)
 
-class OpenapiHomeHandler(TornadoHandler):
-    OPENAPI_JSON = ""
+        if "If-None-Match" in self.request.headers:
+            return self.check_etag_header()
 
-    @basic_auth(api_auth)
-    def get(self):
+        ims_value = self.request.headers.get("If-Modified-Since")
+        if ims_value is not None:
+            try:
+                if_since = email.utils.parsedate_to_datetime(ims_value)
+            except (TypeError, ValueError):
+                return False
+            if if_since.tzinfo is None:
+                if_since = if_since.replace(tzinfo=datetime.timezone.utc)
+            return if_since >= self.doc_content.last_modified
+        return False
+
+    async def write_content(self):
+        if self.site.loader is not None:
+            self.site.loader.ensure_loaded()
+        doc_content = self.doc_content = self.get_doc_content()
+
+        self.set_header("Vary", "Accept-Encoding")
+        encoding = select_encoding(self.request.headers.get("Accept-Encoding"), doc_content.encoded)
+        if encoding:
+            self.set_header("Content-Encoding", encoding)
+
+        if self.check_not_modified():
+            return self.set_status(304)
+
+        content = doc_content.encoded[encoding] if encoding else doc_content.content
+        self.set_header("Content-Length", len(content))
+        view = memoryview(content)
+        try:
+            for offset in range(0, len(content), self.CHUNK_SIZE):
+                self.write(bytes(view[offset : offset + self.CHUNK_SIZE]))
+                await self.flush()
+        except tornado.iostream.StreamClosedError:
+            # 客户端已断开
+            return
+
+
+class SwaggerHomeHandler(DocHomeHandler):
+    CONTENT_NAME = "swagger"
+
+    @basic_auth()
+    async def get(self):
+        await self.write_content()
+
+
+class RedocHomeHandler(DocHomeHandler):
+    CONTENT_NAME = "redoc"
+
+    @basic_auth()
+    async def get(self):
+        await self.write_content()
+
+
+class OpenapiHomeHandler(DocHomeHandler):
+    CONTENT_NAME = "openapi"
+
+    @basic_auth()
+    async def get(self):
         self.set_header("Content-Type", "application/json; charset=UTF-8")
-        self.write(json.dumps(self.OPENAPI_JSON, ensure_ascii=False, cls=CJsonEncoder).replace("</", "<\\/"))
+        await self.write_content()
+
+
+class OpenapiTagHandler(DocHomeHandler):
+    """按 tag 拆分的 openapi json, 每个 tag 的内容同样预先压缩并计算 etag"""
+
+    def get_doc_content(self) -> DocContent:
+        doc_content = self.site.tags.get(self.tag)
+        if doc_content is None:
+            raise tornado.web.HTTPError(404)
+        return doc_content
+
+    @basic_auth()
+    async def get(self, tag):
+        self.tag = tag
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        await self.write_content()
+
+
+class SwaggerStaticHandler(tornado.web.StaticFileHandler):
+    """
+    swagger/redoc 的 js/css 静态资源, 带版本号的请求返回 immutable 缓存头
+    打包时生成的 .gz 文件存在且客户端支持 gzip 时直接返回 .gz 文件, 文件通过 mmap 分块读取, 不占用进程内存
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def validate_absolute_path(self, root, absolute_path):
+        absolute_path = super().validate_absolute_path(root, absolute_path)
+        if absolute_path is None:
+            return None
+
+        # content-type 按原始文件判断
+        self.content_path = absolute_path
+        self.set_header("Vary", "Accept-Encoding")
+        encoded_path = absolute_path + ".gz"
+        if select_encoding(self.request.headers.get("Accept-Encoding"), ["gzip"]) and os.path.isfile(encoded_path):
+            self.set_header("Content-Encoding", "gzip")
+            self._stat_result = os.stat(encoded_path)
+            return encoded_path
+        return absolute_path
+
+    def get_content_type(self):
+        mime_type, _ = mimetypes.guess_type(self.content_path)
+        return mime_type or "application/octet-stream"
+
+    @classmethod
+    def get_content(cls, abspath, start=None, end=None):
+        with open(abspath, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            start = start or 0
+            end = size if end is None else end
+            if start >= end:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for offset in range(start, end, cls.CHUNK_SIZE):
+                    yield mm[offset : min(offset + cls.CHUNK_SIZE, end)]
+
+    def set_extra_headers(self, path):
+        if "v" in self.request.arguments:
+            self.set_header("Cache-Control", "public, max-age=%d, immutable" % self.CACHE_MAX_AGE)
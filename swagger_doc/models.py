@@ -1,7 +1,8 @@
+import json
 from enum import Enum
 from typing import Optional, Type, List, Union, Dict
 
-from pydantic import BaseModel, Field, model_validator, field_validator
+from pydantic import BaseModel, Field, PrivateAttr, model_validator, field_validator
 
 __all__ = [
     "SResponse",
@@ -25,6 +26,8 @@ __all__ = [
     "SecurityModel",
     "SecurityIn",
     "STag",
+    "SchemaRegistry",
+    "clear_schema_cache",
 ]
 
 
@@ -32,17 +35,93 @@ class STag(Enum):
     pass
 
 
-def _parse_one_model(_item, definitions: dict, field: str, required: list):
+class SchemaRegistry:
+    """
+    components/schemas 注册表, 相同的模型只生成一次, 其他地方通过 $ref 引用
+    模型按名称和 json schema 去重, 同一个模型作为顶层模型和其他模型的字段($defs)时只生成一次
+    """
+
+    REF_PREFIX = "#/components/schemas/"
+
+    def __init__(self):
+        self.schemas = {}
+        self._names = {}
+        # 重名时加了序号的名称 -> 原名称
+        self._bases = {}
+
+    def _alloc(self, key, name: str) -> str:
+        ref_name, i = name, 2
+        while ref_name in self.schemas:
+            ref_name = f"{name}{i}"
+            i += 1
+        self._names[key] = ref_name
+        self._bases[ref_name] = name
+        # 先占位, 自引用的模型不会无限递归
+        self.schemas[ref_name] = {}
+        return ref_name
+
+    def ref(self, key, name: str, build) -> dict:
+        ref_name = self._names.get(key)
+        if ref_name is None:
+            ref_name = self._alloc(key, name)
+            self.schemas[ref_name] = build()
+        return {"$ref": self.REF_PREFIX + ref_name}
+
+    def export(self) -> list:
+        """按注册顺序导出 [(key, 原名称, 名称, schema)], key 是 (名称, schema json), 可以直接跨进程传递"""
+        return [(key, self._bases[name], name, self.schemas[name]) for key, name in self._names.items()]
+
+    def merge(self, entries: list) -> dict:
+        """
+        按顺序合并其他 registry export 的内容, 命名规则和直接注册时一致
+        返回 {原引用名称: 新名称}, 引用了这些名称的文档需要用 rename_refs 替换
+        """
+        rename = {}
+        added = []
+        for key, base, name, schema in entries:
+            ref_name = self._names.get(key)
+            if ref_name is None:
+                ref_name = self._alloc(key, base)
+                added.append((ref_name, schema))
+            if ref_name != name:
+                rename[name] = ref_name
+        for ref_name, schema in added:
+            self.schemas[ref_name] = self.rename_refs(schema, rename)
+        return rename
+
+    def prune(self, keep):
+        """删除不在 keep 中的 schema, 之后再引用到对应模型时会重新生成"""
+        keep = set(keep)
+        self.schemas = {name: schema for name, schema in self.schemas.items() if name in keep}
+        self._names = {key: name for key, name in self._names.items() if name in keep}
+        self._bases = {name: base for name, base in self._bases.items() if name in keep}
+
+    @classmethod
+    def rename_refs(cls, obj, rename: dict):
+        if not rename:
+            return obj
+        if isinstance(obj, dict):
+            ret = {k: cls.rename_refs(v, rename) for k, v in obj.items()}
+            ref = ret.get("$ref")
+            if isinstance(ref, str) and ref.startswith(cls.REF_PREFIX) and ref[len(cls.REF_PREFIX) :] in rename:
+                ret["$ref"] = cls.REF_PREFIX + rename[ref[len(cls.REF_PREFIX) :]]
+            return ret
+        if isinstance(obj, list):
+            return [cls.rename_refs(i, rename) for i in obj]
+        return obj
+
+
+def _parse_one_model(_item, definitions: dict, field: str, required: list, registry: SchemaRegistry = None):
 
     # 嵌套对象
     if "properties" in _item:
         ret = {}
         for _field, attrs in _item["properties"].items():
-            ret[_field] = _parse_one_model(attrs, definitions, _field, required)
+            ret[_field] = _parse_one_model(attrs, definitions, _field, required, registry)
         return ret
     # 数组
     elif "items" in _item:
-        items = _parse_one_model(_item["items"], definitions, field, required)
+        items = _parse_one_model(_item["items"], definitions, field, required, registry)
         ret = {"type": "array", "items": items}
         if _item.get("description"):
             ret.update(description=_item["description"])
@@ -50,14 +129,14 @@ def _parse_one_model(_item, definitions: dict, field: str, required: list):
 
     # 对象
     elif "$ref" in _item:
-        return _get_ref_model(_item["$ref"], definitions, field, _item.get("description"))
+        return _get_ref_model(_item["$ref"], definitions, field, _item.get("description"), registry)
     # 枚举
     elif "allOf" in _item:
         return {
             "allOf": [
-                _get_ref_model(i["$ref"], definitions, field, _item.get("description"))
+                _get_ref_model(i["$ref"], definitions, field, _item.get("description"), registry)
                 if "$ref" in i
-                else _parse_one_model(i, definitions, field, required)
+                else _parse_one_model(i, definitions, field, required, registry)
                 for i in _item["allOf"]
             ]
         }
@@ -65,9 +144,9 @@ def _parse_one_model(_item, definitions: dict, field: str, required: list):
     elif "anyOf" in _item:
         return {
             "anyOf": [
-                _get_ref_model(i["$ref"], definitions, field, _item.get("description"))
+                _get_ref_model(i["$ref"], definitions, field, _item.get("description"), registry)
                 if "$ref" in i
-                else _parse_one_model(i, definitions, field, required)
+                else _parse_one_model(i, definitions, field, required, registry)
                 for i in _item["anyOf"]
             ]
         }
@@ -85,34 +164,89 @@ def _parse_one_model(_item, definitions: dict, field: str, required: list):
         return ret
 
 
-def _get_ref_model(ref: str, definitions: dict, field: str, description: str = None):
+def _component_key(name: str, schema: dict) -> tuple:
+    """
+    components/schemas 的去重 key, 按名称和 json schema 去重
+    顶层模型使用去掉 $defs 后的 schema, 与它作为其他模型的字段出现在 $defs 中时的 key 相同
+    """
+    return name, json.dumps(schema, sort_keys=True)
+
+
+def _get_ref_model(ref: str, definitions: dict, field: str, description: str = None, registry: SchemaRegistry = None):
     prefix = "#/$defs/"
     d_name = ref.replace(prefix, "")
     item = definitions[d_name]
-    if "enum" in item:
-        return _parse_one_model(item, definitions, field, item.get("required", []))
-    ret = {
-        "type": "object",
-        "properties": _parse_one_model(item, definitions, field, item.get("required", [])),
-    }
-    if description:
+
+    def build():
+        if "enum" in item:
+            return _parse_one_model(item, definitions, field, item.get("required", []), registry)
+        return {
+            "type": "object",
+            "properties": _parse_one_model(item, definitions, field, item.get("required", []), registry),
+        }
+
+    if registry is None:
+        ret = build()
+    else:
+        ret = registry.ref(_component_key(d_name, item), d_name, build)
+        if description:
+            # $ref 不能有其他属性
+            return {"description": description, "allOf": [ret]}
+        return ret
+
+    if description and "enum" not in item:
         ret.update(description=description)
     return ret
 
 
+_SCHEMA_CACHE = {}
+# clear_schema_cache 时递增, DocModel.gen_doc 的缓存随之失效
+_SCHEMA_CACHE_VERSION = 0
+
+
+def _cache_schema(cls, kind: str, build):
+    """
+    按模型类缓存生成的 schema, 多个接口引用同一个模型时只生成一次
+    __example__ 被替换后重新生成; 返回值是共享的, 不要修改
+    """
+    cached = _SCHEMA_CACHE.get((cls, kind))
+    if cached is not None and cached[0] is cls.__example__:
+        return cached[1]
+    ret = build()
+    _SCHEMA_CACHE[(cls, kind)] = (cls.__example__, ret)
+    return ret
+
+
+def clear_schema_cache(model: type = None):
+    """清除模型的 schema 缓存, 模型代码热更新后调用, model 为空时清除所有缓存"""
+    global _SCHEMA_CACHE_VERSION
+    _SCHEMA_CACHE_VERSION += 1
+    if model is None:
+        _SCHEMA_CACHE.clear()
+        return
+    for key in [key for key in _SCHEMA_CACHE if key[0] is model]:
+        _SCHEMA_CACHE.pop(key, None)
+
+
 class SParam(BaseModel):
     __p_type__ = None
     __example__ = None
     ...
 
     @classmethod
-    def gen_schema(cls) -> List[dict]:
+    def gen_schema(cls, registry: SchemaRegistry = None) -> List[dict]:
+        if registry is None:
+            return list(_cache_schema(cls, "params", cls._gen_params))
+        return cls._gen_params(registry)
+
+    @classmethod
+    def _gen_params(cls, registry: SchemaRegistry = None) -> List[dict]:
         assert cls.__p_type__ is not None, ValueError("do not use Base Param")
-        schema = cls.model_json_schema()
+        schema = _cache_schema(cls, "json_schema", cls.model_json_schema)
 
         ret = []
         for field, _item in schema["properties"].items():
-            one_schema = _parse_one_model(_item, schema.get("$defs", {}), field, schema.get("required", []))
+            one_schema = _parse_one_model(_item, schema.get("$defs", {}), field, schema.get("required", []), registry)
             one = {
                 "name": field,
                 "in": cls.__p_type__,
@@ -156,9 +290,9 @@ class SObjectMeta(BaseModel):
     __content_type__ = None
 
     @classmethod
-    def _gen_properties(cls):
+    def _gen_properties(cls, registry: SchemaRegistry = None):
         assert cls.__example__ is not None, ValueError("do not use Body base")
-        schema = cls.schema()
+        schema = _cache_schema(cls, "json_schema", cls.model_json_schema)
 
         def parse_model_recursively():
             _properties = {}
@@ -170,6 +304,7 @@ class SObjectMeta(BaseModel):
                     schema.get("$defs", {}),
                     field,
                     schema.get("required", []),
+                    registry,
                 )
             return _properties
 
@@ -178,17 +313,33 @@ class SObjectMeta(BaseModel):
         return properties
 
     @classmethod
-    def gen_schema(cls):
-        properties = cls._gen_properties()
+    def _component_key(cls) -> tuple:
+        schema = _cache_schema(cls, "json_schema", cls.model_json_schema)
+        return _component_key(cls.__name__, {key: value for key, value in schema.items() if key != "$defs"})
+
+    @classmethod
+    def gen_schema(cls, registry: SchemaRegistry = None):
+        if registry is None:
+            schema = _cache_schema(
+                cls,
+                "body",
+                lambda: {
+                    "type": "object",
+                    "description": "request body",
+                    "properties": cls._gen_properties(),
+                },
+            )
+        else:
+            schema = registry.ref(
+                _cache_schema(cls, "component_key", cls._component_key),
+                cls.__name__,
+                lambda: {"type": "object", "properties": cls._gen_properties(registry)},
+            )
 
         return {
             "content": {
                 cls.__content_type__: {
-                    "schema": {
-                        "type": "object",
-                        "description": "request body",
-                        "properties": properties,
-                    },
+                    "schema": schema,
                     "example": cls.__example__,
                 }
             }
@@ -288,11 +439,11 @@ class SResponse(BaseModel):
     description: str
     body: Optional[Type[SObject]] = None
 
-    def gen_schema(self):
+    def gen_schema(self, registry: SchemaRegistry = None):
         return {
             self.status_code: {
                 "description": self.description,
-                **self.body.gen_schema(),
+                **self.body.gen_schema(registry),
             }
         }
 
@@ -337,13 +488,41 @@ class DocModel(BaseModel):
     query_params: Optional[Type[SQuery]] = None
     header_params: Optional[Type[SHeader]] = None
 
+    _doc_cache: Optional[tuple] = PrivateAttr(default=None)
+
     @field_validator("auth_required")
     def default_val(cls, val):
         if val is None:
             return True
         return val
 
-    def gen_doc(self):
+    def gen_doc(self, registry: SchemaRegistry = None):
+        """
+        registry 不为空时, 模型生成到 components/schemas 中, 通过 $ref 引用
+        registry 为空时结果会被缓存, 返回值是共享的, 不要修改
+        """
+        if registry is not None:
+            return self._gen_doc(registry)
+
+        examples = self._examples()
+        cached = self._doc_cache
+        # 与 _cache_schema 一致, 模型的 __example__ 被替换后重新生成
+        if (
+            cached is None
+            or cached[0] != _SCHEMA_CACHE_VERSION
+            or len(cached[1]) != len(examples)
+            or any(i is not j for i, j in zip(cached[1], examples))
+        ):
+            cached = self._doc_cache = (_SCHEMA_CACHE_VERSION, examples, self._gen_doc())
+        return cached[2]
+
+    def _examples(self) -> list:
+        """文档中用到的各模型的 __example__"""
+        models = [self.header_params, self.path_params, self.query_params, self.request_body]
+        models.extend(i.body for i in self.responses)
+        return [i.__example__ for i in models if i is not None]
+
+    def _gen_doc(self, registry: SchemaRegistry = None):
         ret = {
             "tags": [i.value if isinstance(i, Enum) else i for i in self.tags],
             "summary": self.summary,
@@ -351,13 +530,13 @@ class DocModel(BaseModel):
             "parameters": [],
         }
         if self.header_params:
-            ret["parameters"].extend(self.header_params.gen_schema())
+            ret["parameters"].extend(self.header_params.gen_schema(registry))
         if self.path_params:
-            ret["parameters"].extend(self.path_params.gen_schema())
+            ret["parameters"].extend(self.path_params.gen_schema(registry))
         if self.query_params:
-            ret["parameters"].extend(self.query_params.gen_schema())
+            ret["parameters"].extend(self.query_params.gen_schema(registry))
         if self.request_body:
-            ret["requestBody"] = self.request_body.gen_schema()
+            ret["requestBody"] = self.request_body.gen_schema(registry)
 
         code_set = {}
 
@@ -370,6 +549,6 @@ class DocModel(BaseModel):
             return f"{c}.{code_set[c]}"
 
         ret["responses"] = {
-            _get_next_code(code): content for i in self.responses for code, content in i.gen_schema().items()
+            _get_next_code(code): content for i in self.responses for code, content in i.gen_schema(registry).items()
         }
         return ret
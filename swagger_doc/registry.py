@@ -0,0 +1,231 @@
+import json
+import threading
+
+from . import __version__
+from .builders import (
+    _build_openapi,
+    _referenced_schemas,
+    build_doc_from_func_doc,
+    format_handler_path,
+    iter_routes,
+    operation_tags,
+    release_doc_caches,
+)
+from .cache import load_cached_spec, spec_fingerprint, store_cached_spec
+from .models import SchemaRegistry
+from .utils import dump_openapi_json
+
+__all__ = ["DocRegistry", "SharedSpecs"]
+
+
+class SharedSpecs:
+    """
+    多套文档共享的模型和接口文档, 例如同一个进程中的公开文档和内部文档
+    模型在共享的 SchemaRegistry 中只生成一次, 同一个接口在多套文档中只生成一次;
+    每套文档的 components/schemas 只包含自己引用到的模型
+    """
+
+    def __init__(self):
+        self.schema_registry = SchemaRegistry()
+        # {(handler, 路径, security): 接口文档}
+        self._operations = {}
+        self.lock = threading.RLock()
+
+    def operation(self, handler, route_path: str, security) -> dict:
+        key = (handler, route_path, security.model_dump_json() if security else None)
+        doc = self._operations.get(key)
+        if doc is None:
+            doc = self._operations[key] = build_doc_from_func_doc(handler, route_path, security, self.schema_registry)
+        return doc
+
+
+class DocRegistry:
+    """
+    文档注册表, setup_swagger 的返回值
+    运行时通过 add_routes/remove_routes 增删路由, 只重新生成受影响的 paths 和 components,
+    再通过 on_change 通知文档 handler 刷新序列化和压缩后的内容
+    """
+
+    def __init__(
+        self,
+        routes,
+        cache_dir: str = None,
+        workers: int = 0,
+        on_change=None,
+        operation_cache=None,
+        shared: SharedSpecs = None,
+        **options,
+    ):
+        self.routes = list(routes)
+        self.cache_dir = cache_dir
+        self.workers = workers
+        # 开发模式下的 OperationCache, 设置后不再使用整份文档的缓存
+        self.operation_cache = operation_cache
+        # 与其他文档共享模型和接口文档, 设置后总是使用 components
+        self.shared = shared
+        if shared is not None:
+            options["use_components"] = True
+        self.options = options
+        # setup_swagger 中创建的 DocSite
+        self.site = None
+        # on_change(受影响的 tag 集合, 全量生成时为 None)
+        self.on_change = on_change
+        self.content = None
+        self._schema = None
+        self._schema_registry = None
+        # {路径: [handler]}, 按路由顺序
+        self._handlers = None
+        self._lock = shared.lock if shared is not None else threading.RLock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.content is not None
+
+    @property
+    def schema(self) -> dict:
+        if self._schema is None and self.content is not None:
+            self._schema = json.loads(self.content)
+        return self._schema
+
+    def release(self):
+        """
+        只保留序列化后的内容, 需要时再从内容解析
+        生成过程中缓存的接口文档和模型 schema 一并释放, 共享的 SharedSpecs 除外
+        """
+        with self._lock:
+            self._schema = None
+            self._handlers = None
+            if self.shared is None:
+                self._schema_registry = None
+                release_doc_caches(self.routes)
+            if self.content is not None:
+                # orjson 按倍数扩容输出缓冲区, 复制一份大小正好的内容
+                self.content = bytes(memoryview(self.content))
+
+    def build(self):
+        """全量生成文档, cache_dir 不为空时路由和模型都没有变化则直接读取之前生成的文档"""
+        with self._lock:
+            self._handlers = None
+            self._schema_registry = None
+            fingerprint = None
+            if self.cache_dir and self.operation_cache is None and self.shared is None:
+                fingerprint = spec_fingerprint(self.routes, __version__, **self.options)
+                content = load_cached_spec(self.cache_dir, fingerprint)
+                if content is not None:
+                    self._schema, self.content = None, content
+                    return self._notify(None)
+
+            if self.options.get("use_components"):
+                self._schema_registry = SchemaRegistry() if self.shared is None else self.shared.schema_registry
+            self._schema = _build_openapi(
+                self.routes,
+                workers=self.workers,
+                registry=self._schema_registry,
+                operation_cache=self.operation_cache,
+                shared=self.shared,
+                **self.options,
+            )
+            self.content = dump_openapi_json(self._schema)
+            if self.operation_cache is not None:
+                self.operation_cache.save()
+            if fingerprint is not None:
+                store_cached_spec(self.cache_dir, fingerprint, self.content)
+            self._notify(None)
+
+    def add_routes(self, routes):
+        """添加路由, 已有的 (handler, 路由正则) 会被替换"""
+        with self._lock:
+            self._remove(routes)
+            self.routes.extend(routes)
+            if self.loaded:
+                self._patch(routes, add=True)
+
+    def remove_routes(self, routes):
+        """删除路由, 按 (handler, 路由正则) 匹配"""
+        with self._lock:
+            self._remove(routes)
+            if self.loaded:
+                self._patch(routes, add=False)
+
+    def _remove(self, routes):
+        keys = {(handler, regex.pattern) for handler, regex in iter_routes(routes)}
+        self.routes = [
+            route
+            for route in self.routes
+            if not any((handler, regex.pattern) in keys for handler, regex in iter_routes([route]))
+        ]
+
+    def _ensure_index(self):
+        if self._handlers is not None:
+            return
+        if self.options.get("use_components") and self._schema_registry is None:
+            # 从磁盘缓存读取的文档没有模型和名称的对应关系, 需要全量生成一次
+            self._schema_registry = SchemaRegistry()
+            self._schema = _build_openapi(
+                self.routes, workers=self.workers, registry=self._schema_registry, **self.options
+            )
+        self._handlers = {}
+        for handler, regex in iter_routes(self.routes):
+            self._handlers.setdefault(format_handler_path(handler, regex.pattern, regex.groups), []).append(handler)
+
+    def _patch(self, routes, add: bool):
+        """只重新生成 routes 涉及的路径"""
+        self._ensure_index()
+
+        changed = {}
+        for handler, regex in iter_routes(routes):
+            route_path = format_handler_path(handler, regex.pattern, regex.groups)
+            changed[route_path] = None
+            handlers = self._handlers.setdefault(route_path, [])
+            if handler in handlers:
+                handlers.remove(handler)
+            if add:
+                handlers.append(handler)
+            if not handlers:
+                self._handlers.pop(route_path)
+
+        schema = self.schema
+        paths = schema["paths"]
+        tags = set()
+        pruned = False
+        for route_path in changed:
+            entry = {}
+            for handler in self._handlers.get(route_path, []):
+                entry.update(self._build_operation(handler, route_path))
+            for operation in paths.get(route_path, {}).values():
+                tags.update(operation_tags(operation))
+                pruned = True
+            for operation in entry.values():
+                tags.update(operation_tags(operation))
+            # 已有的路径原地替换, 保持路径顺序和全量生成时一致
+            if entry:
+                paths[route_path] = entry
+            else:
+                paths.pop(route_path, None)
+
+        if self.shared is not None:
+            # 共享的模型不删除, 只重新计算本文档引用到的模型
+            schemas = self.shared.schema_registry.schemas
+            if pruned:
+                schema["components"]["schemas"] = _referenced_schemas(paths, schemas)
+            else:
+                changed_paths = {route_path: paths[route_path] for route_path in changed if route_path in paths}
+                schema["components"]["schemas"].update(_referenced_schemas(changed_paths, schemas))
+        elif self._schema_registry is not None:
+            if pruned:
+                # 删除或替换接口后可能有不再被引用的模型
+                self._schema_registry.prune(_referenced_schemas(paths, self._schema_registry.schemas))
+            schema["components"]["schemas"] = self._schema_registry.schemas
+
+        self.content = dump_openapi_json(schema)
+        self._notify(tags)
+
+    def _build_operation(self, handler, route_path: str) -> dict:
+        security = self.options.get("security")
+        if self.shared is not None:
+            return self.shared.operation(handler, route_path, security)
+        return build_doc_from_func_doc(handler, route_path, security, self._schema_registry)
+
+    def _notify(self, tags):
+        if self.on_change is not None:
+            self.on_change(tags)
@@ -1,9 +1,16 @@
 import datetime
 import json
+import math
 import time
+from enum import Enum
 
 from pydantic import BaseModel
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class CJsonEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -24,3 +31,81 @@ class CJsonEncoder(json.JSONEncoder):
             return obj.decode("utf8")
         else:
             return json.JSONEncoder.default(self, obj)
+
+
+def copy_tree(obj):
+    """复制由 dict/list 组成的结构, 其他值保持原来的对象; 返回给调用方的文档不会和缓存共享可修改的对象"""
+    if isinstance(obj, dict):
+        return {key: copy_tree(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [copy_tree(value) for value in obj]
+    return obj
+
+
+_C_JSON_ENCODER = CJsonEncoder(ensure_ascii=False)
+
+
+def _orjson_default(obj):
+    # orjson 原生不支持的类型交给 CJsonEncoder, 保证两种后端的结果一致
+    return _C_JSON_ENCODER.default(obj)
+
+
+def _finite(obj):
+    """NaN/Infinity 替换为 null, 与 orjson 一致"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    return obj
+
+
+class _DocJsonEncoder(CJsonEncoder):
+    """标准库后端使用, 与 orjson 的结果一致: Enum 输出 value, NaN/Infinity 输出 null"""
+
+    def default(self, obj):
+        return _finite(obj.value if isinstance(obj, Enum) else super().default(obj))
+
+
+def _dumps_stdlib(obj) -> bytes:
+    try:
+        return json.dumps(obj, ensure_ascii=False, allow_nan=False, cls=_DocJsonEncoder).encode("utf8")
+    except ValueError:
+        # NaN/Infinity 不是合法的 json, 很少出现, 出现时复制一份替换后再序列化
+        return json.dumps(_finite(obj), ensure_ascii=False, allow_nan=False, cls=_DocJsonEncoder).encode("utf8")
+
+
+def _dumps_orjson(obj) -> bytes:
+    try:
+        return orjson.dumps(
+            obj,
+            default=_orjson_default,
+            # 日期和 dataclass 也按 CJsonEncoder 处理, 非字符串的 key 和标准库一样转换成字符串
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS,
+        )
+    except orjson.JSONEncodeError:
+        # 超过 64 位的整数等 orjson 不支持的情况
+        return _dumps_stdlib(obj)
+
+
+JSON_BACKENDS = {"json": _dumps_stdlib}
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = _dumps_orjson
+
+# 默认使用已安装的最快的后端
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def dumps_json(obj, backend: str = None) -> bytes:
+    """
+    序列化为 UTF-8 编码的 json, 日期/timedelta/BaseModel/bytes 的处理与 CJsonEncoder 一致;
+    两种后端都把 Enum 输出为 value, NaN/Infinity 输出为 null(标准库默认输出的 NaN 不是合法的 json)
+    安装了 orjson 时默认使用 orjson, 否则使用标准库
+    """
+    return JSON_BACKENDS[backend or JSON_BACKEND](obj)
+
+
+def dump_openapi_json(openapi_schema, backend: str = None) -> bytes:
+    """序列化 openapi 文档, 结果可直接写入响应"""
+    return dumps_json(openapi_schema, backend).replace(b"</", b"<\\/")
@@ -0,0 +1,241 @@
+import collections
+import functools
+import logging
+import typing
+
+from pydantic import TypeAdapter, ValidationError
+
+from .builders import iter_routes, try_extract_docs
+from .models import DocModel, SForm
+
+__all__ = ["RequestValidator", "validate_request", "ResponseChecker", "RESPONSE_CHECKER"]
+
+_LIST_TYPES = (list, tuple, set, frozenset)
+
+
+def _param_keys(model) -> list:
+    """[(参数名, 是否多值)], 参数名与文档中一致, 有 alias 时使用 alias"""
+    ret = []
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        # Optional[List[int]] 等
+        if typing.get_origin(annotation) is typing.Union:
+            annotation = next((i for i in typing.get_args(annotation) if i is not type(None)), annotation)
+        is_list = annotation in _LIST_TYPES or typing.get_origin(annotation) in _LIST_TYPES
+        ret.append((field.alias or name, is_list))
+    return ret
+
+
+def _arguments_loader(model):
+    """从 tornado 的 query_arguments/body_arguments({名称: [bytes]}) 中取出模型需要的参数"""
+    keys = _param_keys(model)
+
+    def load(arguments: dict) -> dict:
+        data = {}
+        for key, is_list in keys:
+            values = arguments.get(key)
+            if values:
+                data[key] = [i.decode("utf8") for i in values] if is_list else values[-1].decode("utf8")
+        return data
+
+    return load
+
+
+def _headers_loader(model):
+    # 字段名中的 _ 也可以用 - 传递, 例如 x_token 对应 X-Token
+    keys = [(key, key.replace("_", "-")) for key, _ in _param_keys(model)]
+
+    def load(headers) -> dict:
+        data = {}
+        for key, header_name in keys:
+            value = headers.get(key)
+            if value is None and header_name != key:
+                value = headers.get(header_name)
+            if value is not None:
+                data[key] = value
+        return data
+
+    return load
+
+
+def _path_step(model, arg_names: list):
+    adapter = TypeAdapter(model)
+
+    def step(handler, args, kwargs):
+        # 命名分组通过 kwargs 传递, 否则按方法的参数名对应
+        return adapter.validate_python(kwargs or dict(zip(arg_names, args)))
+
+    return step
+
+
+def _query_step(model):
+    adapter, load = TypeAdapter(model), _arguments_loader(model)
+
+    def step(handler, args, kwargs):
+        return adapter.validate_python(load(handler.request.query_arguments))
+
+    return step
+
+
+def _header_step(model):
+    adapter, load = TypeAdapter(model), _headers_loader(model)
+
+    def step(handler, args, kwargs):
+        return adapter.validate_python(load(handler.request.headers))
+
+    return step
+
+
+def _body_step(model):
+    adapter = TypeAdapter(model)
+    if issubclass(model, SForm):
+        load = _arguments_loader(model)
+
+        def step(handler, args, kwargs):
+            return adapter.validate_python(load(handler.request.body_arguments))
+
+    else:
+
+        def step(handler, args, kwargs):
+            # 直接校验原始的请求体, 不需要先 json.loads
+            return adapter.validate_json(handler.request.body)
+
+    return step
+
+
+class RequestValidator:
+    """
+    按 DocModel 中的 path/query/header/body 模型校验请求, 校验通过后结果保存到 handler 的
+    path_params/query_params/header_params/request_body 属性上
+    校验器在第一次请求时创建, 之后的请求直接复用
+    """
+
+    def __init__(self, doc: DocModel, func):
+        self.doc = doc
+        self.func = func
+        self._steps = None
+
+    def _compile(self) -> list:
+        """[(参数位置, handler 属性名, 校验函数)]"""
+        doc = self.doc
+        steps = []
+        if doc.path_params is not None:
+            steps.append(("path", "path_params", _path_step(doc.path_params, try_extract_docs(self.func))))
+        if doc.query_params is not None:
+            steps.append(("query", "query_params", _query_step(doc.query_params)))
+        if doc.header_params is not None:
+            steps.append(("header", "header_params", _header_step(doc.header_params)))
+        if doc.request_body is not None:
+            steps.append(("body", "request_body", _body_step(doc.request_body)))
+        return steps
+
+    def validate(self, handler, args, kwargs) -> bool:
+        """校验通过返回 True, 否则返回 400 和错误详情"""
+        steps = self._steps
+        if steps is None:
+            steps = self._steps = self._compile()
+        for source, attr, step in steps:
+            try:
+                value = step(handler, args, kwargs)
+            except ValidationError as e:
+                errors = e.errors(include_url=False, include_context=False, include_input=False)
+                return self._reject(handler, [{**i, "loc": [source, *i["loc"]]} for i in errors])
+            except UnicodeDecodeError:
+                return self._reject(handler, [{"type": "unicode_error", "loc": [source], "msg": "invalid utf-8"}])
+            setattr(handler, attr, value)
+        return True
+
+    @staticmethod
+    def _reject(handler, errors: list) -> bool:
+        handler.set_status(400)
+        handler.finish({"detail": errors})
+        return False
+
+
+def validate_request(func, doc: DocModel):
+    """包装请求方法, 调用前校验请求参数, 同步和异步方法都支持"""
+    validator = RequestValidator(doc, func)
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not validator.validate(self, args, kwargs):
+            return None
+        return func(self, *args, **kwargs)
+
+    wrapper.__validator__ = validator
+    return wrapper
+
+
+class ResponseChecker:
+    """
+    校验响应是否符合 SResponse 中声明的模型, 由 TornadoHandler 按 RESPONSE_SAMPLE_RATE 抽样调用
+    每个接口的校验器只创建一次; 结果按 "Handler.METHOD 状态码" 计数:
+    checked 校验次数, violations 不符合的次数, errors 最近一次的错误
+    """
+
+    def __init__(self):
+        # {(handler 类, 请求方法): {状态码: [TypeAdapter]}}, 没有文档的接口为 None
+        self._validators = {}
+        self.reset()
+
+    def reset(self):
+        self.checked = collections.Counter()
+        self.violations = collections.Counter()
+        self.errors = {}
+
+    def stats(self) -> dict:
+        return {"checked": dict(self.checked), "violations": dict(self.violations), "errors": dict(self.errors)}
+
+    @staticmethod
+    def _compile(handler_class, method: str):
+        doc = getattr(getattr(handler_class, method.lower(), None), "__swagger__", None)
+        if doc is None:
+            return None
+        validators = {}
+        for response in doc.responses:
+            adapters = validators.setdefault(response.status_code, [])
+            if response.body is not None:
+                adapters.append(TypeAdapter(response.body))
+        return validators
+
+    def prepare(self, routes):
+        """启动时为路由表中所有接口创建校验器"""
+        for handler_class, _ in iter_routes(routes):
+            for method in handler_class.SUPPORTED_METHODS:
+                if (handler_class, method) not in self._validators:
+                    self._validators[handler_class, method] = self._compile(handler_class, method)
+
+    def check(self, handler, body: bytes):
+        key = (type(handler), handler.request.method)
+        if key not in self._validators:
+            self._validators[key] = self._compile(*key)
+        validators = self._validators[key]
+        if validators is None:
+            return
+
+        status = handler.get_status()
+        name = "{}.{} {}".format(key[0].__name__, key[1], status)
+        self.checked[name] += 1
+        adapters = validators.get(status)
+        if adapters is None:
+            self._violate(name, "undeclared status code")
+            return
+        if not adapters:
+            return
+
+        error = None
+        for adapter in adapters:
+            try:
+                adapter.validate_json(body)
+                return
+            except ValidationError as e:
+                error = e.errors(include_url=False, include_context=False, include_input=False)
+        self._violate(name, error)
+
+    def _violate(self, name: str, error):
+        self.violations[name] += 1
+        self.errors[name] = error
+        logging.warning(f"response of {name} does not match the declared model: {error}")
+
+
+RESPONSE_CHECKER = ResponseChecker()
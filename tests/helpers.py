@@ -0,0 +1,22 @@
+"""多个测试模块共用的常量"""
+
+import base64
+
+
+def basic(credentials: str) -> str:
+    return "Basic " + base64.b64encode(credentials.encode()).decode()
+
+
+# setup_swagger 默认的文档账号
+AUTH = {"Authorization": basic("swagger:swagger")}
+
+# setup_swagger 的默认参数, 直接调用 generate_doc_from_endpoints/DocRegistry 时使用
+OPTIONS = dict(
+    servers=None,
+    description="Swagger API definition",
+    api_version="1.0.0",
+    title="Swagger API",
+    contact="",
+    external_docs=None,
+    security=None,
+)
@@ -0,0 +1,146 @@
+import asyncio
+import base64
+import threading
+
+import tornado.web
+from tornado.testing import AsyncHTTPTestCase
+
+from swagger_doc import *
+from swagger_doc.auth import parse_basic_auth
+
+from helpers import basic
+
+GARBAGE = [None, "", "Basic", "Basic ", "Bearer abc", "Basic !!!!", "Basic abc", basic("nocolon"), "Basic " + "=" * 4]
+
+
+def test_parse_basic_auth():
+    assert parse_basic_auth(basic("user:pa:ss")) == ("user", "pa:ss")
+    assert parse_basic_auth("basic  " + base64.b64encode(b"user:").decode()) == ("user", "")
+    assert parse_basic_auth("Basic " + base64.b64encode(b"\xff:x").decode()) == ("�", "x")
+    for header in GARBAGE:
+        assert parse_basic_auth(header) is None
+
+
+def test_plain_auth():
+    auth = PlainAuth("swagger", "swagger")
+    assert auth.check(basic("swagger:swagger"))
+    # 非标准写法解码后再比较
+    assert auth.check("basic " + base64.b64encode(b"swagger:swagger").decode())
+    assert not auth.check(basic("swagger:other"))
+    assert not auth.check(basic("other:swagger"))
+    assert not auth.check("Basic " + "中")
+    for header in GARBAGE:
+        assert not auth.check(header)
+
+
+def test_accepted_cache():
+    calls = []
+
+    def callback(username, password):
+        calls.append(username)
+        return password == "secret"
+
+    auth = CallbackAuth(callback, cache_size=2)
+    for _ in range(3):
+        assert auth.check(basic("a:secret"))
+    assert calls == ["a"]
+    assert not auth.check(basic("a:wrong"))
+    assert not auth.check(basic("a:wrong"))
+    # 校验失败的不缓存
+    assert calls == ["a", "a", "a"]
+
+    auth.check(basic("b:secret"))
+    auth.check(basic("c:secret"))
+    auth.check(basic("a:secret"))
+    assert calls == ["a", "a", "a", "b", "c", "a"]
+
+    uncached = CallbackAuth(callback, cache_size=0)
+    uncached.check(basic("a:secret"))
+    uncached.check(basic("a:secret"))
+    assert calls[-2:] == ["a", "a"]
+
+
+def test_hashed_auth():
+    password_hash = hash_password("secret", iterations=1000)
+    assert "secret" not in password_hash
+    auth = HashedAuth("admin", password_hash)
+    assert auth.check(basic("admin:secret"))
+    assert not auth.check(basic("admin:other"))
+    assert not auth.check(basic("other:secret"))
+    assert hash_password("secret", iterations=1000) != password_hash
+
+
+def test_hashed_auth_off_loop():
+    auth = HashedAuth("admin", hash_password("secret"))
+    assert auth._iterations == 10000
+    threads = []
+    verify = auth.verify
+
+    def recording_verify(username, password):
+        threads.append(threading.current_thread())
+        return verify(username, password)
+
+    auth.verify = recording_verify
+
+    async def run():
+        return [await auth.check_async(header) for header in (basic("admin:wrong"), basic("admin:wrong"), *GARBAGE)]
+
+    assert asyncio.run(run()) == [False] * (2 + len(GARBAGE))
+    # 摘要在线程池中计算, 同一个错误的认证头只计算一次
+    assert len(threads) == 1 and threads[0] is not threading.current_thread()
+
+    assert asyncio.run(auth.check_async(basic("admin:secret")))
+    assert asyncio.run(auth.check_async(basic("admin:secret")))
+    assert len(threads) == 2
+
+
+def test_hashed_auth_max_pending():
+    auth = HashedAuth("admin", hash_password("secret", iterations=1000), max_pending=1)
+    release = threading.Event()
+    verify = auth.verify
+
+    def slow_verify(username, password):
+        release.wait(5)
+        return verify(username, password)
+
+    auth.verify = slow_verify
+
+    async def run():
+        first = asyncio.ensure_future(auth.check_async(basic("admin:secret")))
+        await asyncio.sleep(0)
+        # 等待计算的请求过多时直接拒绝, 不排队
+        rejected = await auth.check_async(basic("admin:other"))
+        release.set()
+        return await first, rejected
+
+    assert asyncio.run(run()) == (True, False)
+
+
+class ItemHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write("ok")
+
+
+class TestDocAuth(AsyncHTTPTestCase):
+    def get_app(self):
+        routes = [(r"/items", ItemHandler)]
+        setup_swagger(routes)
+        setup_swagger(
+            routes,
+            swagger_url="/admin/docs",
+            redoc_url="/admin/redoc",
+            openapi_url="/admin/openapi.json",
+            auth=HashedAuth("admin", hash_password("secret", iterations=1000)),
+        )
+        return tornado.web.Application(routes)
+
+    def test_malformed_headers(self):
+        for header in GARBAGE[1:]:
+            resp = self.fetch("/openapi.json", headers={"Authorization": header})
+            assert resp.code == 401
+            assert resp.headers["WWW-Authenticate"] == "Basic realm=JSL"
+
+    def test_pluggable_auth(self):
+        assert self.fetch("/openapi.json", headers={"Authorization": basic("swagger:swagger")}).code == 200
+        assert self.fetch("/admin/openapi.json", headers={"Authorization": basic("swagger:swagger")}).code == 401
+        assert self.fetch("/admin/openapi.json", headers={"Authorization": basic("admin:secret")}).code == 200
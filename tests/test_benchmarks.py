@@ -0,0 +1,15 @@
+import json
+
+from benchmarks.__main__ import BENCHMARKS, main
+
+
+def test_benchmarks_smoke(tmp_path):
+    output = tmp_path / "result.json"
+    main(
+        ["--endpoints", "3", "--models", "2", "--depth", "2", "--enums", "1", "--repeat", "1", "--output", str(output)]
+    )
+
+    result = json.loads(output.read_text())
+    assert result["environment"]["swagger_doc"]
+    assert {i["name"] for i in result["results"]} == set(BENCHMARKS)
+    assert all(i["median"] > 0 for i in result["results"])
@@ -0,0 +1,53 @@
+import gzip
+import json
+
+import tornado.web
+import yaml
+from pydantic import Field
+
+from swagger_doc import SObject, SResponse200, swagger_doc
+from swagger_doc.__main__ import main
+
+
+class ExportResp(SObject):
+    __example__ = {"name": "abc"}
+
+    name: str = Field(description="名称")
+
+
+class ExportHandler(tornado.web.RequestHandler):
+    @swagger_doc(tags=["export"], summary="export", responses=[SResponse200(body=ExportResp)])
+    def get(self, item_id):
+        pass
+
+
+routes = [(r"/export/(\d+)", ExportHandler)]
+
+
+def make_app():
+    return tornado.web.Application(routes)
+
+
+def test_export(tmp_path):
+    main(["export", "test_cli:routes", "--out", str(tmp_path), "--yaml", "--compress", "--title", "Export"])
+
+    spec = json.loads((tmp_path / "openapi.json").read_bytes())
+    assert spec["info"]["title"] == "Export"
+    assert spec["paths"]["/export/{item_id}"]["get"]["summary"] == "export"
+    assert yaml.safe_load((tmp_path / "openapi.yaml").read_text()) == spec
+    assert gzip.decompress((tmp_path / "openapi.json.gz").read_bytes()) == (tmp_path / "openapi.json").read_bytes()
+    assert (tmp_path / "swagger.html").stat().st_size > 1024 * 1024
+    assert (tmp_path / "redoc.html.gz").exists()
+    assert not (tmp_path / "static").exists()
+
+
+def test_export_app_with_static(tmp_path):
+    main(["export", "test_cli:make_app", "--out", str(tmp_path), "--no-ui", "--static-url-prefix", "/s/"])
+    assert json.loads((tmp_path / "openapi.json").read_bytes())["paths"]["/export/{item_id}"]
+    assert not (tmp_path / "swagger.html").exists()
+
+    main(["export", "test_cli:make_app", "--out", str(tmp_path), "--static-url-prefix", "/s/"])
+    assert 'src="/s/swagger_ui/swagger-ui-bundle.js?v=' in (tmp_path / "swagger.html").read_text()
+    assert (tmp_path / "static" / "swagger_ui" / "swagger-ui-bundle.js").exists()
+    assert (tmp_path / "static" / "redoc_ui" / "redoc.js").exists()
+    assert not (tmp_path / "static" / "redoc_ui" / "ui.jinja2").exists()
@@ -0,0 +1,530 @@
+import gc
+import gzip
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import types
+import tracemalloc
+from typing import List
+from unittest.mock import ANY
+
+import tornado.web
+from pydantic import Field
+from tornado.testing import AsyncHTTPTestCase
+
+from benchmarks import synth
+from helpers import AUTH
+
+from swagger_doc import *
+from swagger_doc import STATIC_PATH
+from swagger_doc.builders import build_doc_from_func_doc, format_handler_path
+from swagger_doc import compress
+from swagger_doc.compress import select_encoding
+
+
+class ItemResp(SObject):
+    __example__ = {"name": "abc"}
+
+    name: str = Field(description="名称")
+
+
+class ItemHandler(tornado.web.RequestHandler):
+    @swagger_doc(tags=["item"], summary="item", responses=[SResponse200(body=ItemResp)])
+    def get(self, item_id):
+        self.write({"name": item_id})
+
+
+def make_routes():
+    return [(r"/items/(\d+)", ItemHandler)]
+
+
+class DocAppTestCase(AsyncHTTPTestCase):
+    """make_routes 的路由加上文档, SETUP_OPTIONS 传给 setup_swagger"""
+
+    SETUP_OPTIONS = {}
+
+    def get_app(self):
+        routes = make_routes()
+        self.docs = setup_swagger(routes, **self.SETUP_OPTIONS)
+        return tornado.web.Application(routes)
+
+
+class TestStaticAssets(DocAppTestCase):
+    SETUP_OPTIONS = {"inline_assets": False}
+
+    def test_home_references_static(self):
+        resp = self.fetch("/docs", headers=AUTH)
+        assert resp.code == 200
+        assert len(resp.body) < 10 * 1024
+        assert b"swagger-ui-bundle.js?v=" in resp.body
+
+        resp = self.fetch("/redoc", headers=AUTH)
+        assert resp.code == 200
+        assert len(resp.body) < 10 * 1024
+        assert b"redoc.js?v=" in resp.body
+
+    def test_static_cache_headers(self):
+        body = self.fetch("/docs", headers=AUTH).body.decode()
+        url = re.search(r'src="(/docs/static/swagger_ui/swagger-ui-bundle\.js\?v=\w+)"', body).group(1)
+        resp = self.fetch(url)
+        assert resp.code == 200
+        assert "immutable" in resp.headers["Cache-Control"]
+        assert resp.headers["Content-Type"].endswith("javascript")
+
+    def test_static_content(self):
+        path = os.path.join(STATIC_PATH, "swagger_ui", "swagger-ui.css")
+        with open(path, "rb") as f:
+            content = f.read()
+
+        resp = self.fetch("/docs/static/swagger_ui/swagger-ui.css", decompress_response=False)
+        assert resp.code == 200
+        assert resp.body == content
+        assert resp.headers["Content-Type"] == "text/css"
+
+        resp = self.fetch("/docs/static/swagger_ui/swagger-ui.css", headers={"Range": "bytes=10-99"})
+        assert resp.code == 206
+        assert resp.body == content[10:100]
+
+
+class TestStaticGzip(AsyncHTTPTestCase):
+    def get_app(self):
+        # 在静态目录的副本中生成 .gz, 不修改安装包中的文件
+        self.static_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_path)
+        shutil.copytree(os.path.join(STATIC_PATH, "swagger_ui"), os.path.join(self.static_path, "swagger_ui"))
+        return tornado.web.Application([(r"/docs/static/(.*)", SwaggerStaticHandler, {"path": self.static_path})])
+
+    def test_static_gzip(self):
+        path = os.path.join(self.static_path, "swagger_ui", "swagger-ui.css")
+        with open(path, "rb") as f:
+            content = f.read()
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip.compress(content))
+        resp = self.fetch(
+            "/docs/static/swagger_ui/swagger-ui.css",
+            headers={"Accept-Encoding": "gzip"},
+            decompress_response=False,
+        )
+        assert resp.code == 200
+        assert resp.headers["Content-Encoding"] == "gzip"
+        assert resp.headers["Content-Type"] == "text/css"
+        assert gzip.decompress(resp.body) == content
+
+
+class TestInlineAssets(DocAppTestCase):
+
+    def test_home_inline(self):
+        resp = self.fetch("/docs", headers=AUTH)
+        assert resp.code == 200
+        assert b"/docs/static/" not in resp.body
+        assert len(resp.body) > 1024 * 1024
+
+
+class TestConditionalGet(DocAppTestCase):
+
+    def test_etag(self):
+        for url in ("/openapi.json", "/docs", "/redoc"):
+            resp = self.fetch(url, headers=AUTH)
+            assert resp.code == 200
+            etag = resp.headers["Etag"]
+            assert etag.startswith('"')
+
+            resp = self.fetch(url, headers={**AUTH, "If-None-Match": etag})
+            assert resp.code == 304
+            assert resp.body == b""
+
+            resp = self.fetch(url, headers={**AUTH, "If-None-Match": '"other"'})
+            assert resp.code == 200
+
+    def test_if_modified_since(self):
+        resp = self.fetch("/openapi.json", headers=AUTH)
+        last_modified = resp.headers["Last-Modified"]
+
+        resp = self.fetch("/openapi.json", headers={**AUTH, "If-Modified-Since": last_modified})
+        assert resp.code == 304
+
+        resp = self.fetch("/openapi.json", headers={**AUTH, "If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"})
+        assert resp.code == 200
+
+        resp = self.fetch("/openapi.json", headers={**AUTH, "If-Modified-Since": "garbage"})
+        assert resp.code == 200
+
+
+class TestOpenapiJson(DocAppTestCase):
+
+    def test_preserialized(self):
+        content = DocSite.DEFAULT.openapi.content
+        assert isinstance(content, bytes)
+        resp = self.fetch("/openapi.json", headers=AUTH)
+        assert resp.code == 200
+        assert resp.headers["Content-Type"] == "application/json; charset=UTF-8"
+        assert resp.body == content
+        assert json.loads(resp.body)["paths"]["/items/{item_id}"]["get"]["summary"] == "item"
+
+    def test_chunked_write(self):
+        flushes = []
+        flush = DocHomeHandler.flush
+
+        def counting_flush(handler, *args, **kwargs):
+            if handler._write_buffer:
+                flushes.append(sum(map(len, handler._write_buffer)))
+            return flush(handler, *args, **kwargs)
+
+        DocHomeHandler.CHUNK_SIZE = 100
+        DocHomeHandler.flush = counting_flush
+        try:
+            resp = self.fetch("/openapi.json", headers=AUTH, decompress_response=False)
+        finally:
+            del DocHomeHandler.flush
+            DocHomeHandler.CHUNK_SIZE = 64 * 1024
+        content = DocSite.DEFAULT.openapi.content
+        assert resp.body == content
+        assert int(resp.headers["Content-Length"]) == len(content)
+        assert len(flushes) == -(-len(content) // 100)
+        assert max(flushes) <= 100
+
+
+class TestCompression(DocAppTestCase):
+
+    def test_gzip(self):
+        for url in ("/openapi.json", "/docs", "/redoc"):
+            plain = self.fetch(url, headers=AUTH, decompress_response=False)
+            assert "Content-Encoding" not in plain.headers
+            assert plain.headers["Vary"] == "Accept-Encoding"
+
+            resp = self.fetch(url, headers={**AUTH, "Accept-Encoding": "gzip"}, decompress_response=False)
+            assert resp.code == 200
+            assert resp.headers["Content-Encoding"] == "gzip"
+            assert resp.headers["Vary"] == "Accept-Encoding"
+            assert gzip.decompress(resp.body) == plain.body
+            assert resp.headers["Etag"] != plain.headers["Etag"]
+
+            resp = self.fetch(
+                url,
+                headers={**AUTH, "Accept-Encoding": "gzip", "If-None-Match": resp.headers["Etag"]},
+                decompress_response=False,
+            )
+            assert resp.code == 304
+
+    def test_refused_encoding(self):
+        resp = self.fetch("/openapi.json", headers={**AUTH, "Accept-Encoding": "gzip;q=0"}, decompress_response=False)
+        assert "Content-Encoding" not in resp.headers
+
+
+def test_select_encoding():
+    assert select_encoding(None, ["gzip"]) is None
+    assert select_encoding("gzip, deflate", ["gzip", "br"]) == "gzip"
+    assert select_encoding("gzip, br", ["gzip", "br"]) == "br"
+    assert select_encoding("br;q=0.5, gzip", ["gzip", "br"]) == "gzip"
+    assert select_encoding("identity", ["gzip"]) is None
+    assert select_encoding("*", ["gzip"]) == "gzip"
+
+
+CONTENT = b"abc" * 1000
+
+
+def _fake_compress(name):
+    return lambda content, level: b"%s-%d" % (name, level)
+
+
+def test_compress_brotli(monkeypatch):
+    brotli = types.SimpleNamespace(compress=lambda content, quality: b"br-%d" % quality)
+    monkeypatch.setattr(compress, "brotli", brotli)
+    monkeypatch.setattr(compress, "zstd", None)
+    assert compress.compress_variants(CONTENT) == {"gzip": ANY, "br": b"br-11"}
+
+
+def test_compress_zstd_stdlib(monkeypatch):
+    class ZstdCompressor:
+        # 标准库的 ZstdCompressor 默认不输出完整的 frame, 不能使用
+        def __init__(self, *args, **kwargs):
+            raise AssertionError("ZstdCompressor should not be used")
+
+    zstd = types.SimpleNamespace(
+        ZstdCompressor=ZstdCompressor,
+        compress=_fake_compress(b"zstd"),
+        CompressionParameter=types.SimpleNamespace(
+            compression_level=types.SimpleNamespace(bounds=lambda: (-131072, 22))
+        ),
+    )
+    monkeypatch.setattr(compress, "brotli", None)
+    monkeypatch.setattr(compress, "zstd", zstd)
+    monkeypatch.setattr(compress, "ZSTD_STDLIB", True)
+    assert compress.compress_variants(CONTENT) == {"gzip": ANY, "zstd": b"zstd-22"}
+
+
+def test_compress_zstandard(monkeypatch):
+    class ZstdCompressor:
+        def __init__(self, level):
+            self.level = level
+
+        def compress(self, content):
+            return b"zstandard-%d" % self.level
+
+    zstd = types.SimpleNamespace(ZstdCompressor=ZstdCompressor, MAX_COMPRESSION_LEVEL=22)
+    monkeypatch.setattr(compress, "brotli", None)
+    monkeypatch.setattr(compress, "zstd", zstd)
+    monkeypatch.setattr(compress, "ZSTD_STDLIB", False)
+    assert compress.compress_variants(CONTENT) == {"gzip": ANY, "zstd": b"zstandard-22"}
+
+
+class TestLazy(DocAppTestCase):
+    SETUP_OPTIONS = {"lazy": True}
+
+    def test_load_on_first_request(self):
+        loader = self.docs.site.loader
+        assert not loader.loaded
+        assert self.docs.site.openapi.content == b""
+        resp = self.fetch("/openapi.json", headers=AUTH)
+        assert resp.code == 200
+        assert loader.loaded
+        assert json.loads(resp.body)["paths"]["/items/{item_id}"]["get"]["summary"] == "item"
+
+
+def test_doc_loader_once():
+    calls = []
+    loader = DocLoader(lambda: calls.append(1))
+    threads = [threading.Thread(target=loader.ensure_loaded) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == [1]
+
+
+def _retained_memory(routes, **kwargs) -> tuple:
+    """setup_swagger 之后文档相关对象占用的内存, 返回 (内存, DocRegistry)"""
+    DocSite.DEFAULT = DocSite()
+    gc.collect()
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        docs = setup_swagger(routes, **kwargs)
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return after - before, docs
+
+
+def test_lean_memory():
+    default, _ = _retained_memory(make_routes())
+    lean, _ = _retained_memory(make_routes(), lean=True)
+    assert DocSite.DEFAULT.openapi_json is None
+    assert DocSite.DEFAULT.swagger_template == ""
+    # 默认模式页面中内联了 1MB 以上的 js
+    assert default > 2 * 1024 * 1024
+    assert lean < 256 * 1024
+
+    # 接口和模型较多时, 生成过程中缓存的接口文档和模型 schema 也要释放, 只剩下序列化后的内容
+    lean, docs = _retained_memory(synth.make_routes(500), lean=True)
+    assert len(docs.content) > 4 * 1024 * 1024
+    assert lean < len(docs.content) * 1.25
+
+
+class TestLean(DocAppTestCase):
+    SETUP_OPTIONS = {"lean": True}
+
+    def test_pages_fetch_spec(self):
+        resp = self.fetch("/docs", headers=AUTH)
+        assert b'url: "/openapi.json"' in resp.body
+        resp = self.fetch("/redoc", headers=AUTH)
+        assert b'Redoc.init("/openapi.json"' in resp.body
+
+        resp = self.fetch("/openapi.json", headers=AUTH)
+        assert json.loads(resp.body)["paths"]["/items/{item_id}"]["get"]["summary"] == "item"
+
+
+class OtherHandler(tornado.web.RequestHandler):
+    @swagger_doc(tags=["other tag"], summary="other", responses=[SResponse200(body=ItemResp)])
+    def get(self):
+        pass
+
+
+class TestSplitTags(AsyncHTTPTestCase):
+    def get_app(self):
+        routes = make_routes() + [(r"/other", OtherHandler)]
+        setup_swagger(routes, split_tags=True, use_components=True)
+        return tornado.web.Application(routes)
+
+    def test_tag_docs(self):
+        resp = self.fetch("/openapi/item.json", headers=AUTH)
+        assert resp.code == 200
+        assert resp.headers["Content-Type"] == "application/json; charset=UTF-8"
+        doc = json.loads(resp.body)
+        assert list(doc["paths"]) == ["/items/{item_id}"]
+        assert list(doc["components"]["schemas"]) == ["ItemResp"]
+
+        resp = self.fetch("/openapi/other%20tag.json", headers=AUTH)
+        assert list(json.loads(resp.body)["paths"]) == ["/other"]
+
+        resp = self.fetch("/openapi/other%20tag.json", headers={**AUTH, "If-None-Match": resp.headers["Etag"]})
+        assert resp.code == 304
+        assert self.fetch("/openapi/missing.json", headers=AUTH).code == 404
+        assert self.fetch("/openapi/item.json").code == 401
+
+    def test_swagger_urls(self):
+        resp = self.fetch("/docs", headers=AUTH)
+        urls = json.loads(re.search(rb"urls: (\[.*?\]),\n", resp.body).group(1))
+        assert urls == [
+            {"url": "/openapi/item.json", "name": "item"},
+            {"url": "/openapi/other%20tag.json", "name": "other tag"},
+            {"url": "/openapi.json", "name": "all"},
+        ]
+
+
+class VPath(SPath):
+    __example__ = {"item_id": 1}
+
+    item_id: int = Field(description="id")
+
+
+class VQuery(SQuery):
+    __example__ = {"page": 1}
+
+    page: int = Field(1, description="page")
+    ids: List[int] = Field([], description="ids")
+
+
+class VHeader(SHeader):
+    __example__ = {"x_token": "abc"}
+
+    x_token: str = Field(description="token")
+
+
+class VBody(SBody):
+    __example__ = {"name": "abc"}
+
+    name: str = Field(description="名称")
+    count: int = Field(description="数量")
+
+
+class VForm(SForm):
+    __example__ = {"name": "abc"}
+
+    name: str = Field(description="名称")
+
+
+class ValidatedHandler(tornado.web.RequestHandler):
+    @swagger_doc(
+        tags=["item"],
+        summary="item",
+        responses=[SResponse200(body=ItemResp)],
+        path_params=VPath,
+        query_params=VQuery,
+        header_params=VHeader,
+        request_body=VBody,
+        validate=True,
+    )
+    async def post(self, item_id):
+        self.write(
+            {
+                "item_id": self.path_params.item_id,
+                "page": self.query_params.page,
+                "ids": self.query_params.ids,
+                "token": self.header_params.x_token,
+                "body": self.request_body.model_dump(),
+            }
+        )
+
+    @swagger_doc(
+        tags=["item"], summary="form", responses=[SResponse200(body=ItemResp)], request_body=VForm, validate=True
+    )
+    def put(self, item_id):
+        self.write({"name": self.request_body.name})
+
+
+class TestValidate(AsyncHTTPTestCase):
+    def get_app(self):
+        return tornado.web.Application([(r"/items/(\d+)", ValidatedHandler)])
+
+    def test_valid(self):
+        resp = self.fetch(
+            "/items/3?page=2&ids=1&ids=2",
+            method="POST",
+            headers={"X-Token": "abc"},
+            body=json.dumps({"name": "n", "count": "5"}),
+        )
+        assert resp.code == 200
+        assert json.loads(resp.body) == {
+            "item_id": 3,
+            "page": 2,
+            "ids": [1, 2],
+            "token": "abc",
+            "body": {"name": "n", "count": 5},
+        }
+
+        resp = self.fetch(
+            "/items/3",
+            method="PUT",
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            body="name=form",
+        )
+        assert json.loads(resp.body) == {"name": "form"}
+
+    def test_invalid(self):
+        resp = self.fetch("/items/3?page=x", method="POST", headers={"X-Token": "abc"}, body="{}")
+        assert resp.code == 400
+        assert json.loads(resp.body)["detail"] == [{"type": "int_parsing", "loc": ["query", "page"], "msg": ANY}]
+
+        resp = self.fetch("/items/3", method="POST", body="{}")
+        assert json.loads(resp.body)["detail"][0]["loc"] == ["header", "x_token"]
+
+        resp = self.fetch("/items/3", method="POST", headers={"X-Token": "abc"}, body='{"name": "n"')
+        assert resp.code == 400
+        assert json.loads(resp.body)["detail"][0]["loc"] == ["body"]
+
+    def test_doc_unchanged(self):
+        doc = build_doc_from_func_doc(ValidatedHandler, "/items/{item_id}", None)
+        assert doc["post"]["parameters"][0]["in"] == "header"
+        assert [i["name"] for i in doc["post"]["parameters"] if i["in"] == "path"] == ["item_id"]
+        assert format_handler_path(ValidatedHandler, r"/items/(\d+)$", 1) == "/items/{item_id}"
+
+
+class SampledHandler(TornadoHandler):
+    RESPONSE_SAMPLE_RATE = 1
+    RESPONSE_CHECKER = ResponseChecker()
+
+    @swagger_doc(tags=["item"], summary="item", responses=[SResponse200(body=ItemResp)])
+    def get(self, kind):
+        if kind == "ok":
+            self.write({"name": "abc"})
+        elif kind == "bad":
+            self.finish({"title": "abc"})
+        elif kind == "flushed":
+            self.write({"title": "abc"})
+            self.flush()
+        else:
+            self.set_status(418)
+
+
+class TestResponseSampling(AsyncHTTPTestCase):
+    def get_app(self):
+        SampledHandler.RESPONSE_CHECKER.reset()
+        return tornado.web.Application([(r"/sampled/(\w+)", SampledHandler)])
+
+    def test_sampling(self):
+        checker = SampledHandler.RESPONSE_CHECKER
+        checker.prepare([(r"/sampled/(\w+)", SampledHandler)])
+        for kind in ("ok", "ok", "bad", "flushed", "teapot"):
+            resp = self.fetch(f"/sampled/{kind}")
+            assert resp.code in (200, 418)
+        assert json.loads(self.fetch("/sampled/bad").body) == {"title": "abc"}
+
+        stats = checker.stats()
+        assert stats["checked"] == {"SampledHandler.GET 200": 4, "SampledHandler.GET 418": 1}
+        assert stats["violations"] == {"SampledHandler.GET 200": 2, "SampledHandler.GET 418": 1}
+        assert stats["errors"]["SampledHandler.GET 200"][0]["loc"] == ("name",)
+        assert stats["errors"]["SampledHandler.GET 418"] == "undeclared status code"
+
+    def test_disabled(self):
+        SampledHandler.RESPONSE_SAMPLE_RATE = 0
+        try:
+            self.fetch("/sampled/bad")
+        finally:
+            SampledHandler.RESPONSE_SAMPLE_RATE = 1
+        assert SampledHandler.RESPONSE_CHECKER.stats()["checked"] == {}
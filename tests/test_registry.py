@@ -0,0 +1,239 @@
+import json
+import os
+
+import pytest
+import tornado.web
+from pydantic import Field
+from tornado.testing import AsyncHTTPTestCase
+
+from swagger_doc import *
+from swagger_doc.builders import generate_doc_from_endpoints
+from swagger_doc.cache import OperationCache
+
+from helpers import AUTH, OPTIONS, basic
+
+
+class Pet(SObject):
+    __example__ = {"name": "abc"}
+
+    name: str = Field(description="名称")
+
+
+class Owner(SObject):
+    __example__ = {"name": "abc", "pet": {"name": "abc"}}
+
+    name: str = Field(description="名称")
+    pet: Pet = Field(description="宠物")
+
+
+class PetHandler(tornado.web.RequestHandler):
+    @swagger_doc(tags=["pet"], summary="pet", responses=[SResponse200(body=Pet)])
+    def get(self, pet_id):
+        pass
+
+
+class PetUpdateHandler(tornado.web.RequestHandler):
+    @swagger_doc(tags=["pet"], summary="update pet", request_body=Pet, responses=[SResponse200(body=Pet)])
+    def post(self, pet_id):
+        pass
+
+
+class OwnerHandler(tornado.web.RequestHandler):
+    @swagger_doc(tags=["owner"], summary="owner", responses=[SResponse200(body=Owner)])
+    def get(self):
+        pass
+
+
+PET = [(r"/pets/(?P<pet_id>\d+)", PetHandler)]
+PET_UPDATE = [(r"/pets/(?P<pet_id>\d+)", PetUpdateHandler)]
+OWNER = [(r"/owners", OwnerHandler)]
+
+
+@pytest.mark.parametrize("use_components", [False, True])
+def test_incremental_matches_full(use_components):
+    docs = DocRegistry(PET, use_components=use_components, **OPTIONS)
+    docs.build()
+
+    docs.add_routes(OWNER + PET_UPDATE)
+    expected = generate_doc_from_endpoints(PET + OWNER + PET_UPDATE, use_components=use_components, **OPTIONS)
+    assert docs.schema == json.loads(json.dumps(expected))
+    assert json.loads(docs.content) == docs.schema
+
+    docs.remove_routes(OWNER)
+    expected = generate_doc_from_endpoints(PET + PET_UPDATE, use_components=use_components, **OPTIONS)
+    assert docs.schema == json.loads(json.dumps(expected))
+    if use_components:
+        assert list(docs.schema["components"]["schemas"]) == ["Pet"]
+
+    # 重复添加会替换已有的路由
+    docs.add_routes(PET)
+    assert len(docs.routes) == 2
+    expected = generate_doc_from_endpoints(PET_UPDATE + PET, use_components=use_components, **OPTIONS)
+    assert docs.schema == json.loads(json.dumps(expected))
+
+
+def test_changed_tags():
+    changes = []
+    docs = DocRegistry(PET, on_change=changes.append, **OPTIONS)
+    docs.add_routes(OWNER)
+    # 还没有生成时只记录路由
+    assert changes == []
+    docs.build()
+    docs.add_routes(OWNER)
+    docs.remove_routes(PET)
+    assert changes == [None, {"owner"}, {"pet"}]
+    assert list(docs.schema["paths"]) == ["/owners"]
+
+
+def test_patch_cached_spec(tmp_path):
+    DocRegistry(PET, cache_dir=str(tmp_path), use_components=True, **OPTIONS).build()
+
+    docs = DocRegistry(PET, cache_dir=str(tmp_path), use_components=True, **OPTIONS)
+    docs.build()
+    docs.add_routes(OWNER)
+    expected = generate_doc_from_endpoints(PET + OWNER, use_components=True, **OPTIONS)
+    assert docs.schema == json.loads(json.dumps(expected))
+
+
+class TestDynamicRoutes(AsyncHTTPTestCase):
+    def get_app(self):
+        routes = list(PET)
+        self.docs = setup_swagger(routes, split_tags=True, use_components=True)
+        return tornado.web.Application(routes)
+
+    def test_add_and_remove(self):
+        before = self.fetch("/openapi.json", headers=AUTH)
+        page = self.fetch("/docs", headers=AUTH).body
+
+        self._app.wildcard_router.add_rules(OWNER)
+        self.docs.add_routes(OWNER)
+        resp = self.fetch("/openapi.json", headers={**AUTH, "If-None-Match": before.headers["Etag"]})
+        assert resp.code == 200
+        assert resp.headers["Etag"] != before.headers["Etag"]
+        assert list(json.loads(resp.body)["paths"]) == ["/pets/{pet_id}", "/owners"]
+
+        resp = self.fetch("/openapi/owner.json", headers=AUTH)
+        doc = json.loads(resp.body)
+        assert list(doc["paths"]) == ["/owners"]
+        assert len(doc["components"]["schemas"]) == 2
+        assert self.fetch("/docs", headers=AUTH).body != page
+
+        self.docs.remove_routes(PET)
+        assert self.fetch("/openapi/pet.json", headers=AUTH).code == 404
+        assert list(json.loads(self.fetch("/openapi.json", headers=AUTH).body)["paths"]) == ["/owners"]
+
+
+MODELS_SOURCE = """
+from pydantic import Field
+from swagger_doc import SObject
+
+
+class Item(SObject):
+    __example__ = {"name": "abc"}
+
+    name: str = Field(description="名称")
+"""
+
+HANDLERS_SOURCE = """
+import tornado.web
+from swagger_doc import SResponse200, swagger_doc
+from {package}.models import Item
+
+
+class {name}Handler(tornado.web.RequestHandler):
+    @swagger_doc(tags=["{name}"], summary="{name}", responses=[SResponse200(body=Item)])
+    def get(self):
+        pass
+"""
+
+
+def test_operation_cache(tmp_path, monkeypatch):
+    package = tmp_path / "dev_app"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "models.py").write_text(MODELS_SOURCE)
+    for name in ("a", "b"):
+        (package / f"{name}.py").write_text(HANDLERS_SOURCE.format(package="dev_app", name=name))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    from dev_app import a, b
+
+    routes = [(r"/a", a.aHandler), (r"/b", b.bHandler)]
+    cache_dir = str(tmp_path / "cache")
+    expected = json.loads(json.dumps(generate_doc_from_endpoints(routes, **OPTIONS)))
+
+    def build():
+        cache = OperationCache(cache_dir, "test", **OPTIONS)
+        docs = DocRegistry(routes, operation_cache=cache, **OPTIONS)
+        docs.build()
+        assert docs.schema == expected
+        return cache.hits, cache.misses
+
+    assert build() == (0, 2)
+    # 重启后没有修改的接口直接使用缓存
+    assert build() == (2, 0)
+
+    stat = os.stat(a.__file__)
+    os.utime(a.__file__, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert build() == (1, 1)
+
+    stat = os.stat(package / "models.py")
+    os.utime(package / "models.py", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert build() == (0, 2)
+
+    # 生成参数变化时缓存失效
+    assert (
+        OperationCache(cache_dir, "test", **{**OPTIONS, "title": "other"}).path
+        != OperationCache(cache_dir, "test", **OPTIONS).path
+    )
+
+
+def test_setup_swagger_dev(tmp_path):
+    docs = setup_swagger(list(PET), dev=True, cache_dir=str(tmp_path))
+    assert docs.site.openapi.encoded == {}
+    assert os.listdir(tmp_path)[0].startswith("operations-")
+
+
+class TestMultipleSites(AsyncHTTPTestCase):
+    def get_app(self):
+        shared = SharedSpecs()
+        public, internal = list(PET), PET + OWNER
+        self.public = setup_swagger(public, shared=shared)
+        self.internal = setup_swagger(
+            internal,
+            swagger_url="/internal/docs",
+            redoc_url="/internal/redoc",
+            openapi_url="/internal/openapi.json",
+            login_username="admin",
+            login_password="secret",
+            shared=shared,
+        )
+        # 内部文档中的 PET 路由已经在 public 中
+        return tornado.web.Application(public + internal[len(PET) :])
+
+    def test_independent_sites(self):
+        public = json.loads(self.fetch("/openapi.json", headers=AUTH).body)
+        assert list(public["paths"]) == ["/pets/{pet_id}"]
+        assert list(public["components"]["schemas"]) == ["Pet"]
+
+        admin = {"Authorization": basic("admin:secret")}
+        assert self.fetch("/internal/openapi.json", headers=AUTH).code == 401
+        internal = json.loads(self.fetch("/internal/openapi.json", headers=admin).body)
+        assert list(internal["paths"]) == ["/pets/{pet_id}", "/owners"]
+        assert list(internal["components"]["schemas"]) == ["Pet", "Owner"]
+        assert self.fetch("/internal/docs", headers=admin).code == 200
+        assert self.fetch("/docs", headers=admin).code == 401
+
+    def test_shared_operations(self):
+        # 两套文档中相同的接口和模型是同一份
+        pet, internal_pet = (docs.schema["paths"]["/pets/{pet_id}"]["get"] for docs in (self.public, self.internal))
+        assert pet is internal_pet
+        assert (
+            self.public.schema["components"]["schemas"]["Pet"] is self.internal.schema["components"]["schemas"]["Pet"]
+        )
+
+        self.public.add_routes(OWNER)
+        assert list(self.public.schema["components"]["schemas"]) == ["Pet", "Owner"]
+        self.public.remove_routes(OWNER)
+        assert list(self.public.schema["components"]["schemas"]) == ["Pet"]
+        # 共享的模型不会被删除
+        assert list(self.internal.schema["components"]["schemas"]) == ["Pet", "Owner"]
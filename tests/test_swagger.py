@@ -1,10 +1,34 @@
+import json
 from enum import IntEnum
 from typing import Optional
 
+import pytest
+import tornado.web
 from pydantic import Field, BaseModel
+from tornado.routing import AnyMatches, PathMatches, Rule, RuleRouter
 
 from swagger_doc import *
-from swagger_doc.models import SecurityModel, SecurityType, SecuritySchema, SResponse200, SForm
+from swagger_doc.cache import load_cached_spec, spec_fingerprint, store_cached_spec
+from swagger_doc.utils import dump_openapi_json
+from swagger_doc.builders import (
+    build_doc_from_func_doc,
+    generate_doc_from_endpoints,
+    format_handler_path,
+    iter_routes,
+    parse_route_pattern,
+    split_doc_by_tags,
+)
+from swagger_doc.models import (
+    SecurityModel,
+    SecurityType,
+    SecuritySchema,
+    SResponse200,
+    SForm,
+    SchemaRegistry,
+    clear_schema_cache,
+)
+
+from helpers import OPTIONS
 
 
 class TQuery(SQuery):
@@ -677,3 +701,412 @@ def test_multi_part_request():
             }
         },
     }
+
+
+def test_components():
+    registry = SchemaRegistry()
+    doc = post.__swagger__.gen_doc(registry)
+    assert doc["requestBody"]["content"]["application/json"]["schema"] == {"$ref": "#/components/schemas/TBody"}
+    assert doc["responses"]["200"]["content"]["application/json"]["schema"] == {
+        "$ref": "#/components/schemas/SuccessResp"
+    }
+    assert list(registry.schemas) == ["TBody", "Like", "RLike", "LLike", "SuccessResp"]
+    assert registry.schemas["TBody"]["properties"]["favorite"] == {"$ref": "#/components/schemas/Like"}
+    assert registry.schemas["TBody"]["properties"]["like"] == {
+        "type": "array",
+        "items": {"$ref": "#/components/schemas/Like"},
+    }
+    assert registry.schemas["Like"] == {
+        "type": "object",
+        "properties": {"name": {"description": "喜爱东西的名称", "required": True, "type": "string"}},
+    }
+
+    # 同一个模型只生成一次
+    post.__swagger__.gen_doc(registry)
+    assert len(registry.schemas) == 5
+
+
+def test_components_name_conflict():
+    class SuccessResp(SBody):
+        __example__ = {"code": 0}
+
+        code: int = Field(description="code")
+
+    registry = SchemaRegistry()
+    assert SResponse200(body=globals()["SuccessResp"]).gen_schema(registry)[200]["content"]["application/json"][
+        "schema"
+    ] == {"$ref": "#/components/schemas/SuccessResp"}
+    assert SResponse200(body=SuccessResp).gen_schema(registry)[200]["content"]["application/json"]["schema"] == {
+        "$ref": "#/components/schemas/SuccessResp2"
+    }
+
+
+def test_components_nested_and_top_level():
+    class User(SObject):
+        __example__ = {"name": "abc", "like": {"name": "abc"}}
+
+        name: str = Field(description="name")
+        like: Like
+
+    class UserList(SObject):
+        __example__ = {"users": []}
+
+        users: List[User] = Field(description="users")
+
+    registry = SchemaRegistry()
+    SResponse200(body=User).gen_schema(registry)
+    SResponse200(body=UserList).gen_schema(registry)
+    assert list(registry.schemas) == ["User", "Like", "UserList"]
+    assert registry.schemas["UserList"]["properties"]["users"]["items"] == {"$ref": "#/components/schemas/User"}
+
+    # 先作为字段出现也只生成一次
+    registry = SchemaRegistry()
+    SResponse200(body=UserList).gen_schema(registry)
+    SResponse200(body=User).gen_schema(registry)
+    assert list(registry.schemas) == ["UserList", "User", "Like"]
+
+
+def test_components_field_description():
+    class DescBody(SBody):
+        __example__ = {}
+
+        favorite: Like = Field(description="i am favorite")
+
+    registry = SchemaRegistry()
+    DescBody.gen_schema(registry)
+    assert registry.schemas["DescBody"]["properties"]["favorite"] == {
+        "description": "i am favorite",
+        "allOf": [{"$ref": "#/components/schemas/Like"}],
+    }
+
+
+def test_schema_cache(monkeypatch):
+    class CachedQuery(SQuery):
+        __example__ = {"page": 1}
+
+        page: int = Field(description="page")
+
+    class CachedBody(SBody):
+        __example__ = {"name": "abc"}
+
+        name: str = Field(description="name")
+
+    calls = []
+    origin = BaseModel.model_json_schema.__func__
+
+    def model_json_schema(cls, *args, **kwargs):
+        calls.append(cls)
+        return origin(cls, *args, **kwargs)
+
+    monkeypatch.setattr(BaseModel, "model_json_schema", classmethod(model_json_schema))
+
+    first = CachedQuery.gen_schema()
+    assert CachedQuery.gen_schema() == first
+    assert CachedBody.gen_schema() == CachedBody.gen_schema()
+    assert calls == [CachedQuery, CachedBody]
+
+    # __example__ 被替换后重新生成
+    CachedQuery.__example__ = {"page": 2}
+    assert CachedQuery.gen_schema()[0]["example"] == 2
+    assert calls == [CachedQuery, CachedBody, CachedQuery]
+
+    clear_schema_cache(CachedBody)
+    CachedBody.gen_schema()
+    CachedQuery.gen_schema()
+    assert calls == [CachedQuery, CachedBody, CachedQuery, CachedBody]
+
+    clear_schema_cache()
+    CachedQuery.gen_schema()
+    assert calls[-1] is CachedQuery and len(calls) == 5
+
+
+def test_gen_doc_cache():
+    doc = post.__swagger__.gen_doc()
+    assert post.__swagger__.gen_doc() is doc
+
+    class Handler(tornado.web.RequestHandler):
+        post = staticmethod(post)
+
+    first = build_doc_from_func_doc(Handler, "/a/{id}", None)["post"]
+    second = build_doc_from_func_doc(Handler, "/b/{id}", None)["post"]
+    assert first["operationId"] != second["operationId"]
+    assert first["requestBody"] is doc["requestBody"]
+    assert "operationId" not in doc
+
+    clear_schema_cache()
+    assert post.__swagger__.gen_doc() is not doc
+    assert post.__swagger__.gen_doc() == doc
+
+
+class SharedQuery(SQuery):
+    __example__ = {"a": 1}
+
+    a: int = Field(description="a")
+
+
+class SharedBody(SBody):
+    __example__ = {"a": 1, "like": {"name": "abc"}}
+
+    a: int = Field(description="a")
+    like: Like
+
+
+def _shared_model_routes():
+    class HHandler(tornado.web.RequestHandler):
+        @swagger_doc(tags=["h"], summary="h", responses=[SResponse200(body=SharedBody)], query_params=SharedQuery)
+        def get(self):
+            pass
+
+    class QHandler(tornado.web.RequestHandler):
+        @swagger_doc(tags=["q"], summary="q", responses=[SResponse200(body=SharedBody)], query_params=SharedQuery)
+        def get(self):
+            pass
+
+    return [(r"/h", HHandler), (r"/q", QHandler)]
+
+
+def test_gen_doc_cache_example():
+    class ExampleBody(SBody):
+        __example__ = {"name": "abc"}
+
+        name: str = Field(description="name")
+
+    class ExampleHandler(tornado.web.RequestHandler):
+        @swagger_doc(tags=["example"], summary="example", responses=[SResponse200(body=ExampleBody)])
+        def get(self):
+            pass
+
+    def example():
+        return export_swagger([(r"/example", ExampleHandler)])["paths"]["/example"]["get"]["responses"]["200"][
+            "content"
+        ]["application/json"]["example"]
+
+    assert example() == {"name": "abc"}
+    ExampleBody.__example__ = {"name": "changed"}
+    assert example() == {"name": "changed"}
+
+
+def test_schema_cache_not_shared_with_result():
+    routes = _shared_model_routes()
+    first = generate_doc_from_endpoints(routes, **OPTIONS)
+    expected = json.loads(dump_openapi_json(first))
+
+    h = first["paths"]["/h"]["get"]
+    h["parameters"][0]["schema"]["description"] = "changed"
+    h["responses"]["200"]["content"]["application/json"]["schema"]["properties"]["a"]["description"] = "changed"
+    h["responses"]["200"]["content"]["application/json"]["schema"]["properties"]["like"]["properties"].clear()
+    assert json.loads(dump_openapi_json(first["paths"]["/q"])) == expected["paths"]["/q"]
+    assert json.loads(dump_openapi_json(generate_doc_from_endpoints(routes, **OPTIONS))) == expected
+
+
+def test_export_swagger_returns_copy():
+    routes = _shared_model_routes()
+    first = export_swagger(routes)
+    first["paths"]["/h"]["get"]["tags"].append("extra")
+    first["paths"]["/h"]["get"]["responses"]["200"]["description"] = "changed"
+    second = export_swagger(routes)
+    assert second["paths"]["/h"]["get"]["tags"] == ["h"]
+    assert second["paths"]["/h"]["get"]["responses"]["200"]["description"] != "changed"
+    assert export_swagger(routes, use_components=True)["paths"]["/h"]["get"]["tags"] == ["h"]
+
+
+def test_iter_routes():
+    class AHandler(tornado.web.RequestHandler):
+        pass
+
+    class BHandler(tornado.web.RequestHandler):
+        pass
+
+    sub_app = tornado.web.Application([(r"/app/(\d+)", AHandler)])
+    sub_app.add_handlers(r"example\.com", [(r"/host", BHandler)])
+
+    routes = [
+        tornado.web.url(r"/url", AHandler),
+        (r"/tuple", AHandler, {"a": 1}),
+        (r"/nested", [(r"/nested/a", AHandler), (r"/nested/b", [(r"/nested/b/c", BHandler)])]),
+        Rule(PathMatches(r"/rule"), BHandler),
+        (r"/router.*", RuleRouter([(r"/router/a", AHandler)])),
+        Rule(AnyMatches(), sub_app),
+        Rule(AnyMatches(), BHandler),
+        (r"/import", "swagger_doc.handlers.OpenapiHomeHandler"),
+    ]
+    assert [(handler, regex.pattern) for handler, regex in iter_routes(routes)] == [
+        (AHandler, "/url$"),
+        (AHandler, "/tuple$"),
+        (BHandler, "/rule$"),
+        (OpenapiHomeHandler, "/import$"),
+        (AHandler, "/nested/a$"),
+        (AHandler, "/router/a$"),
+        (BHandler, "/nested/b/c$"),
+        (BHandler, "/host$"),
+        (AHandler, r"/app/(\d+)$"),
+    ]
+
+    with pytest.raises(ValueError):
+        list(iter_routes([object()]))
+
+
+def test_format_handler_path():
+    class PathHandler(tornado.web.RequestHandler):
+        def get(self, project_id, item_id):
+            pass
+
+        def delete(self, _, item_id):
+            pass
+
+    def fmt(pattern):
+        regex = PathMatches(pattern).regex
+        return format_handler_path(PathHandler, regex.pattern, regex.groups)
+
+    assert fmt(r"/projects/(\d+)/items/([^/]+)") == "/projects/{project_id}/items/{item_id}"
+    assert fmt(r"/projects/(?P<pid>\d+)") == "/projects/{pid}"
+    # 嵌套的分组, 字符集和转义的括号
+    assert fmt(r"/projects/((?:a|b)\d+)/items/(\w+)") == "/projects/{project_id}/items/{item_id}"
+    assert fmt(r"/projects/([()]+)/\(x\)") == r"/projects/{project_id}/\(x\)"
+    assert fmt(r"/p/(?:v1|v2)/(\d+)") == "/p/(?:v1|v2)/{project_id}"
+    assert parse_route_pattern(r"/(a(b)c)/(\d+)$") == ("/", (0, None), "/", (2, None), "$")
+
+
+def test_parallel_generation():
+    class ConflictResp(SBody):
+        __example__ = {"code": 0}
+
+        code: int = Field(description="code")
+
+    ConflictResp.__name__ = "SuccessResp"
+
+    def make_handler(i):
+        responses = [SResponse200(body=SuccessResp if i % 3 else ConflictResp)]
+
+        @swagger_doc(tags=["t"], summary=f"get {i}", responses=responses, query_params=TQuery)
+        def get(self, item_id):
+            pass
+
+        @swagger_doc(tags=["t"], summary=f"post {i}", responses=responses, request_body=TBody, path_params=TPath)
+        def post(self, id):
+            pass
+
+        return type(f"Handler{i}", (tornado.web.RequestHandler,), {"get": get, "post": post})
+
+    routes = [(rf"/items{i}/(\d+)", make_handler(i)) for i in range(20)]
+    for use_components in (False, True):
+        sequential = export_swagger(routes, use_components=use_components)
+        parallel = export_swagger(routes, use_components=use_components, workers=3)
+        assert dump_openapi_json(parallel) == dump_openapi_json(sequential)
+
+    assert list(sequential["components"]["schemas"]) == [
+        "SuccessResp",
+        "TBody",
+        "Like",
+        "RLike",
+        "LLike",
+        "SuccessResp2",
+    ]
+
+
+def test_spec_cache(tmp_path, monkeypatch):
+    import swagger_doc as package
+    from swagger_doc import registry
+
+    calls = []
+    build_openapi = registry._build_openapi
+
+    def recording_build(*args, **kwargs):
+        calls.append(1)
+        return build_openapi(*args, **kwargs)
+
+    monkeypatch.setattr(registry, "_build_openapi", recording_build)
+
+    class CachedHandler(tornado.web.RequestHandler):
+        @swagger_doc(tags=["cache"], summary="cache", responses=[SResponse200(body=SuccessResp)], request_body=TBody)
+        def post(self, item_id):
+            pass
+
+    routes = [(r"/cache/(\d+)", CachedHandler)]
+    spec = export_swagger(routes, cache_dir=str(tmp_path))
+    cache_files = list(tmp_path.iterdir())
+    assert len(cache_files) == 1
+    assert json.loads(cache_files[0].read_bytes()) == json.loads(dump_openapi_json(spec))
+    assert calls == [1]
+
+    # 命中缓存时不再生成文档
+    assert export_swagger(routes, cache_dir=str(tmp_path)) == json.loads(dump_openapi_json(spec))
+    assert calls == [1]
+
+    fingerprint = spec_fingerprint(routes, package.__version__, title="Swagger API")
+    assert spec_fingerprint(routes, package.__version__, title="Swagger API") == fingerprint
+    assert spec_fingerprint(routes, "0.0.0", title="Swagger API") != fingerprint
+    assert spec_fingerprint(routes, package.__version__, title="other") != fingerprint
+    CachedHandler.post.__swagger__.summary = "changed"
+    assert spec_fingerprint(routes, package.__version__, title="Swagger API") != fingerprint
+
+
+def test_spec_fingerprint_base_model(monkeypatch):
+    from swagger_doc import cache
+
+    class BaseResp(SObject):
+        code: int = Field(description="code")
+
+    class Resp(BaseResp):
+        __example__ = {"code": 0, "name": "abc"}
+
+        name: str = Field(description="name")
+
+    class BaseHandler(tornado.web.RequestHandler):
+        @swagger_doc(tags=["base"], summary="base", responses=[SResponse200(body=Resp)])
+        def get(self):
+            pass
+
+    assert [i[1].split(".")[-1] for i in cache._model_fingerprint(Resp)][:2] == ["Resp", "BaseResp"]
+
+    routes = [(r"/base", BaseHandler)]
+    fingerprint = spec_fingerprint(routes, "test")
+    # 父类的源码变化(例如修改了字段的 description)
+    source_hash = cache._class_source_hash
+    monkeypatch.setattr(cache, "_class_source_hash", lambda cls: "changed" if cls is BaseResp else source_hash(cls))
+    assert spec_fingerprint(routes, "test") != fingerprint
+
+
+def test_store_cached_spec(tmp_path):
+    store_cached_spec(str(tmp_path / "cache"), "abc", b"{}")
+    store_cached_spec(str(tmp_path / "cache"), "abc", b'{"a": 1}')
+    assert load_cached_spec(str(tmp_path / "cache"), "abc") == b'{"a": 1}'
+    assert load_cached_spec(str(tmp_path / "cache"), "other") is None
+    assert [i.name for i in (tmp_path / "cache").iterdir()] == ["openapi-abc.json"]
+
+
+def test_split_doc_by_tags():
+    ref = SchemaRegistry.REF_PREFIX
+    swagger = {
+        "openapi": "3.0.0",
+        "paths": {
+            "/a": {
+                "get": {"tags": ["a"], "responses": {"200": {"schema": {"$ref": ref + "A"}}}},
+                "post": {"tags": ["a", "b"], "responses": {}},
+            },
+            "/b": {"get": {"tags": ["b"], "responses": {"200": {"schema": {"$ref": ref + "B"}}}}},
+            "/c": {"get": {"responses": {}}},
+        },
+        "components": {
+            "securitySchemes": {"basic": {}},
+            "schemas": {
+                "A": {"properties": {"nested": {"$ref": ref + "Nested"}}},
+                "Nested": {"type": "object"},
+                "B": {"type": "object"},
+                "Unused": {"type": "object"},
+            },
+        },
+    }
+    docs = split_doc_by_tags(swagger)
+    assert list(docs) == ["a", "b", "default"]
+
+    assert list(docs["a"]["paths"]) == ["/a"]
+    assert list(docs["a"]["paths"]["/a"]) == ["get", "post"]
+    assert list(docs["a"]["components"]["schemas"]) == ["A", "Nested"]
+    assert docs["a"]["components"]["securitySchemes"] == {"basic": {}}
+
+    assert docs["b"]["paths"] == {"/a": {"post": swagger["paths"]["/a"]["post"]}, "/b": swagger["paths"]["/b"]}
+    assert list(docs["b"]["components"]["schemas"]) == ["B"]
+    assert docs["default"]["components"]["schemas"] == {}
+    # 原文档不变
+    assert len(swagger["components"]["schemas"]) == 4
@@ -0,0 +1,55 @@
+import datetime
+import json
+from enum import Enum
+
+import pytest
+from pydantic import BaseModel
+
+from swagger_doc.utils import JSON_BACKENDS, CJsonEncoder, dump_openapi_json, dumps_json
+
+
+class Color(Enum):
+    RED = "red"
+
+
+class Inner(BaseModel):
+    at: datetime.datetime
+    raw: bytes
+
+
+PAYLOAD = {
+    "datetime": datetime.datetime(2024, 1, 2, 3, 4, 5, 678000),
+    "date": datetime.date(2024, 1, 2),
+    "timedelta": datetime.timedelta(days=1, seconds=2, microseconds=3),
+    "model": Inner(at=datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc), raw=b"abc"),
+    "bytes": "中文".encode("utf8"),
+    "nested": [{"html": "</script>", 1: 2.5, "none": None}],
+    "big": 2**70,
+    "enum": Color.RED,
+    "nan": [float("nan"), float("inf"), -float("inf")],
+}
+
+
+@pytest.mark.parametrize("backend", sorted(JSON_BACKENDS))
+def test_backend_parity(backend):
+    # Enum 输出 value, NaN/Infinity 输出 null
+    expected = {**PAYLOAD, "enum": "red", "nan": [None] * 3}
+    expected = json.loads(json.dumps(expected, ensure_ascii=False, cls=CJsonEncoder))
+    assert json.loads(dumps_json(PAYLOAD, backend)) == expected
+    # 没有超过 64 位的整数时 orjson 不会回退到标准库
+    expected.pop("big")
+    assert json.loads(dumps_json({k: v for k, v in PAYLOAD.items() if k != "big"}, backend)) == expected
+    assert "中文" in dumps_json(PAYLOAD, backend).decode("utf8")
+
+
+@pytest.mark.parametrize("backend", sorted(JSON_BACKENDS))
+def test_dump_openapi_json_escape(backend):
+    content = dump_openapi_json({"description": "</script>"}, backend)
+    assert b"</" not in content
+    assert json.loads(content) == {"description": "</script>"}
+
+
+@pytest.mark.parametrize("backend", sorted(JSON_BACKENDS))
+def test_unsupported_type(backend):
+    with pytest.raises(TypeError):
+        dumps_json({"value": object()}, backend)